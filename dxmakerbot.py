@@ -1,19 +1,11 @@
 #!/usr/bin/env python3
-import time
-import random
 import argparse
 import sys
-import logging
 from utils import dxbottools
-from utils import getpricing as pricebot
-from utils import dxsettings
-
-logging.basicConfig(filename='botdebug.log',
-                    level=logging.INFO,
-                    format='%(asctime)s %(levelname)s - %(message)s',
-                    datefmt='[%Y-%m-%d:%H:%M:%S]')
+from utils import botlog
 
 parser = argparse.ArgumentParser()
+parser.add_argument('--config', help='run every market in this JSON config file in one process (see README)')
 parser.add_argument('--maker', help='asset being sold (default=BLOCK)', default='BLOCK')
 parser.add_argument('--taker', help='asset being bought (default=LTC)', default='LTC')
 parser.add_argument('--sellmin', help='min maker sell order size (default=0.001)', default=0.001)
@@ -21,29 +13,47 @@ parser.add_argument('--sellmax', help='max maker sell order size (default=1)', d
 parser.add_argument('--slidemin', help='minimum order price multipler (default=1.000001) minimum order price = slidemin * price source quote', default=1.000001)
 parser.add_argument('--slidemax', help='maximum order price multipler (default=1.019999) maximum order price = slidemax * price source quote', default=1.019999)
 parser.add_argument('--delay', help='sleep delay, in seconds, between loops to place/cancel orders (default=3)', default=3)
+parser.add_argument('--maxdelay', help='longest delay, in seconds, between loops once markets are idle (default=30)', default=None)
 parser.add_argument('--maxloop', help='number of loops before canceling the oldest order (default=7)', default=7)
+parser.add_argument('--maxage', help='seconds before canceling the oldest order (default=maxloop * delay)', default=None)
+parser.add_argument('--pricethreshold', help='price move, as a fraction, that cancels and requotes open orders (default=0.02)', default=0.02)
 parser.add_argument('--maxopen', help='max number of open orders (default=5)', default=5)
+parser.add_argument('--ladder', help='place up to this many orders per loop as a price ladder in one batched call (default=0, one random order per loop)', default=0)
+parser.add_argument('--ladderdist', help='ladder price/size spread: linear, geometric or random (default=linear)', default='linear')
 parser.add_argument('--minbalance', help='min balance you want to maintain of the asset being sold (default=10)', default=10)
 parser.add_argument('--usecb', help='enable cryptobridge pricing', action='store_true')
 parser.add_argument('--usecg', help='enable coingecko pricing', action='store_true')
 parser.add_argument('--usecustom', help='enable custom pricing', action='store_true')
+parser.add_argument('--useagg', help='enable aggregate pricing from all sources in dxsettings.pricesources', action='store_true')
+parser.add_argument('--usefeed', help='read prices from the pricefeed.py daemon, which prices from the source the other pricing flags pick (default=dxsettings.feedsource)', action='store_true')
+parser.add_argument('--pricettl', help='seconds a fetched price is reused before refreshing it in the background (default=10)', default=None)
+parser.add_argument('--pricemaxstale', help='stop quoting when the price could not be refreshed for this many seconds (default=120)', default=None)
 parser.add_argument('--cancelall', help='cancel all orders and exit', action='store_true')
 parser.add_argument('--cancelmarket', help='cancel all orders in a given market')
+parser.add_argument('--metricsport', help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default=off)', default=None)
+parser.add_argument('--cancelrate', help='max order cancels per second for --cancelall/--cancelmarket (default=dxsettings.cancelrate)', default=None)
+parser.add_argument('--journal', help='order journal the bot picks its open orders up from after a restart (default=orderjournal.db)', default=None)
+parser.add_argument('--nojournal', help='do not keep an order journal', action='store_true')
+parser.add_argument('--statusfile', help='write the last pass of every market to this JSON file, for dxsupervisor.py (default=off)', default=None)
+parser.add_argument('--verbosity', help='quiet (warnings), loop (one line per loop) or debug (every step) (default=loop)', default='loop')
+parser.add_argument('--logfile', help='JSON lines log file, rotated by size (default=botdebug.log)', default=botlog.LOGFILE)
+parser.add_argument('--logmaxbytes', help='log file size that starts a new file (default=10485760)', default=botlog.MAXBYTES)
+parser.add_argument('--logbackups', help='rotated log files kept (default=5)', default=botlog.BACKUPS)
 args = parser.parse_args()
 
+try:
+    botlog.setup(args.logfile, args.verbosity, args.logmaxbytes, args.logbackups)
+except ValueError as e:
+    print('ERROR: {}'.format(e))
+    sys.exit(1)
+
 BOTsellmarket = args.maker.upper()
 BOTbuymarket = args.taker.upper()
-BOTslidemin = float(args.slidemin)
-BOTslidemax = float(args.slidemax)
-BOTdelay = args.delay
+BOTdelay = float(args.delay)
 
-BOTminbalance = args.minbalance
-maxloopcount = args.maxloop
-maxordercount = args.maxopen
-loopcount = 0
-ordercount = 0
-
-if args.usecustom:
+if args.useagg:
+    BOTuse = 'agg'
+elif args.usecustom:
     BOTuse = 'custom'
 elif args.usecg:
     BOTuse = 'cg'
@@ -51,96 +61,90 @@ elif args.usecb:
     BOTuse = 'cb'
 else:
     BOTuse = 'bt'
+BOTfeedsource = None
+if args.usefeed:
+    if args.useagg or args.usecustom or args.usecg or args.usecb:
+        BOTfeedsource = BOTuse
+    BOTuse = 'feed'
+
+try:
+    BOTcancelrate = float(args.cancelrate) if args.cancelrate else None
+except ValueError:
+    BOTcancelrate = 0
+if BOTcancelrate is not None and not BOTcancelrate > 0:
+    print('ERROR: --cancelrate must be a number above 0, got {}'.format(args.cancelrate))
+    sys.exit(1)
 
 if args.cancelall:
-    results = dxbottools.cancelallorders()
-    print(results)
+    results = dxbottools.cancelallorders(BOTcancelrate)
     sys.exit(0)
 elif args.cancelmarket:
-    results = dxbottools.cancelallordersbymarket(args.cancelmarket.upper(), BOTbuymarket)
+    results = dxbottools.cancelallordersbymarket(args.cancelmarket.upper(), BOTbuymarket, BOTcancelrate)
     sys.exit(0)
 
+# only making markets needs the pricing and engine modules
+from utils import getpricing as pricebot
+from utils import makerengine
+from utils import metrics
+
+BOTmaxdelay = float(args.maxdelay) if args.maxdelay else makerengine.MAXDELAY
+if BOTfeedsource:
+    pricebot.feedsource = BOTfeedsource
+if args.pricettl:
+    pricebot.pricecache.ttl = float(args.pricettl)
+if args.pricemaxstale:
+    pricebot.pricecache.maxstale = float(args.pricemaxstale)
+
 print('>>>> Start maker bot')
-time.sleep(BOTdelay) # wait for cancel orders
-print(BOTsellmarket, BOTbuymarket)
-print('>>>> Checking pricing information')
-if BOTsellmarket == BOTbuymarket:
-    print('ERROR: Maker and taker asset cannot be the same')
-    sys.exit(0)
-marketprice = pricebot.getpricedata(BOTsellmarket, BOTbuymarket, BOTuse)
-if marketprice == 0:
-    print('#### Pricing not available')
+try:
+    if args.config:
+        config, markets = makerengine.loadconfig(args.config)
+        BOTuse = config.get('price', BOTuse)
+        BOTdelay = config.get('delay', BOTdelay)
+        BOTmaxdelay = config.get('maxdelay', BOTmaxdelay)
+        if config.get('endpoint'):
+            dxbottools.connect(**config['endpoint'])
+    else:
+        markets = [makerengine.MarketMaker(BOTsellmarket, BOTbuymarket,
+                                           sellmin=args.sellmin, sellmax=args.sellmax,
+                                           slidemin=args.slidemin, slidemax=args.slidemax,
+                                           maxloop=args.maxloop, maxopen=args.maxopen,
+                                           minbalance=args.minbalance, maxage=args.maxage,
+                                           pricethreshold=args.pricethreshold,
+                                           ladder=args.ladder, ladderdist=args.ladderdist)]
+except (KeyError, ValueError, TypeError, OSError) as e:
+    print('ERROR: {}'.format(e))
     sys.exit(1)
+print(', '.join(str(market) for market in markets))
 
-print('>>>> Market price: {}'.format(pricebot.getpricedata(BOTsellmarket, BOTbuymarket, BOTuse)))
+if args.metricsport:
+    metrics.serve(args.metricsport)
+    print('>>>> Metrics on http://127.0.0.1:{}/metrics'.format(args.metricsport))
 
-# order loop
+journal = None
+if not args.nojournal:
+    from utils import journal as orderjournal
+    journal = orderjournal.Journal(args.journal or orderjournal.JOURNALFILE)
+
+engine = makerengine.MakerEngine(markets, BOTuse, BOTdelay, BOTmaxdelay, journal, args.statusfile)
+print('>>>> Checking pricing information')
 try:
-    makeraddress = dxsettings.tradingaddress[BOTsellmarket]
-    takeraddress = dxsettings.tradingaddress[BOTbuymarket]
-except KeyError as e:
-    print('ERROR: {}'.format(e))
-    print('Check dxsettings.py for address entry')
+    priced = engine.checkprices()
+except Exception as e:
+    print('ERROR: pricing failed: {}'.format(e))
+    sys.exit(1)
+if not priced:
+    print('#### Pricing not available')
     sys.exit(1)
+if journal is not None:
+    engine.restore()
 
 if __name__ == '__main__':
-    while 1:  # loop forever
-        mybalances = dxbottools.rpc_connection.dxGetTokenBalances()
-        makerbalance = float(mybalances[BOTsellmarket])
-        print('>>>> Pre-start balances: {}'.format(makerbalance))
-        while makerbalance > 0:
-            makermarketprice = pricebot.getpricedata(BOTsellmarket, BOTbuymarket, BOTuse)
-            print('>>>> Market price: {}'.format(makermarketprice))
-            mybalances = dxbottools.rpc_connection.dxGetTokenBalances()
-            makerbalance = float(mybalances[BOTsellmarket])
-            print('>>>> Balances: {}'.format(makerbalance))
-            # generate random sell amount
-            sellamount = random.uniform(float(args.sellmin), float(args.sellmax))
-            sellamount = '%.6f' % sellamount
-            # adjust price based on slide value
-            print('>>>> Market price: {}'.format(makermarketprice))
-            print('>>>> slidemin: {}'.format(BOTslidemin))
-            print('>>>> slidemax: {}'.format(BOTslidemax))
-            makermarketpriceslide = float(makermarketprice) * float(random.uniform(BOTslidemin, BOTslidemax))
-            print('>>>> Slide adjusted maker price: {}'.format(makermarketpriceslide))
-            print('>>>> Sell amount: {}'.format(str(sellamount)))
-            buyamount = (float(sellamount) * float(makermarketpriceslide)) 
-            buyamountclean = '%.6f' % buyamount
-            print('>>>> Buy amount {}'.format(buyamountclean))
-            currentopenorders = len(dxbottools.getopenordersbymarket(BOTsellmarket,BOTbuymarket))
-            print('>>>> Current open orders: {}, maker: {}, taker: {}'.format(currentopenorders, BOTsellmarket, BOTbuymarket))
-            if (ordercount < maxordercount) and (currentopenorders < (maxordercount)):
-                try:
-                    print('>>>> Placing order...')
-                    results = {}
-                    results = dxbottools.makeorder(BOTsellmarket, str(sellamount), makeraddress, BOTbuymarket, str(buyamountclean), takeraddress)
-                    print('>>>> Order placed - id: {0}, maker_size: {1}, taker_size: {2}'.format(results['id'], results['maker_size'], results['taker_size']))
-                    logging.info('Order placed - id: {0}, maker_size: {1}, taker_size: {2}'.format(results['id'], results['maker_size'], results['taker_size']))
-                except Exception as err:
-                    print('ERROR: %s' % err)
-            else:
-                print('##### Too many orders open - open order count: {}, loopcount: {}'.format(currentopenorders, loopcount))
-            loopcount += 1
-            ordercount += 1
-            print('sleep')
-            time.sleep(BOTdelay)
-            if loopcount > maxloopcount:
-                results = dxbottools.canceloldestorder(BOTsellmarket, BOTbuymarket)
-                logging.info('Canceled order ID: {} '.format(results))
-                print('>>>> Canceled oldest: {}'.format(results))
-                loopcount = 0
-                ordercount = 0
-                time.sleep(BOTdelay)
-        if makerbalance <= BOTminbalance:
-            loopcount += 1
-        if loopcount > maxloopcount:
-            results = dxbottools.canceloldestorder(BOTsellmarket, BOTbuymarket)
-            logging.info('Canceled order ID: {} '.format(results))
-            print('>>>> Canceled oldest: {}'.format(results))
-            loopcount = 0
-            ordercount = 0
-            time.sleep(BOTdelay)
-            print('>>>> Canceled oldest sleeping...')
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        # Ctrl-C, or dxsupervisor.py stopping its workers
+        print('>>>> Maker bot stopped')
 
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
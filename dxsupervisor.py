@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import argparse
+import signal
+import sys
+from utils import botlog
+from utils import supervisor
+
+parser = argparse.ArgumentParser(description='runs the markets of a config in several dxmakerbot.py processes, one or more per wallet RPC endpoint, '
+                                             'restarts the ones that exit and shows their status together. '
+                                             'other flags are passed on to every worker')
+parser.add_argument('--config', help='JSON config file with the markets and the endpoints to run them on (see README)', required=True)
+parser.add_argument('--workers', help='number of worker processes, at least one per endpoint used (default=one per endpoint)', default=None)
+parser.add_argument('--workdir', help='directory for the worker configs, journals, logs and status files (default=workers)', default=supervisor.WORKDIR)
+parser.add_argument('--statusinterval', help='seconds between combined status views (default=10)', default=supervisor.STATUSINTERVAL)
+parser.add_argument('--statusfile', help='combined status JSON file (default=WORKDIR/status.json)', default=None)
+parser.add_argument('--metricsport', help='serve each worker\'s Prometheus metrics on PORT + its number (default=off)', default=None)
+parser.add_argument('--verbosity', help='quiet (warnings), loop (status views and restarts) or debug (default=loop)', default='loop')
+parser.add_argument('--logfile', help='JSON lines log file of the supervisor, rotated by size (default=supervisor.log)', default='supervisor.log')
+args, workerargs = parser.parse_known_args()
+
+try:
+    botlog.setup(args.logfile, args.verbosity)
+except ValueError as e:
+    print('ERROR: {}'.format(e))
+    sys.exit(1)
+
+try:
+    config = supervisor.loadconfig(args.config)
+except (KeyError, ValueError, OSError) as e:
+    print('ERROR: {}'.format(e))
+    sys.exit(1)
+shards = supervisor.shard(config, int(args.workers) if args.workers else 1)
+
+sup = supervisor.Supervisor(shards, args.workdir, workerargs, args.statusinterval, args.statusfile)
+if args.metricsport:
+    for worker in sup.workers:
+        worker.args += ['--metricsport', str(int(args.metricsport) + worker.index)]
+print('>>>> Start supervisor, {} workers'.format(len(sup.workers)))
+
+
+def terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+# stopped by a service manager as by Ctrl-C, the workers are stopped too
+signal.signal(signal.SIGTERM, terminate)
+try:
+    sup.run()
+except KeyboardInterrupt:
+    print('>>>> Workers stopped')
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
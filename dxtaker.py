@@ -4,29 +4,118 @@ import random
 import argparse
 import sys
 from utils import dxbottools
-from utils import trexbot
+from utils import botlog
 from utils import dxsettings
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--maker', help='maker chain', default='BLOCK')
 parser.add_argument('--taker', help='taker chain', default='LTC')
+parser.add_argument('--continuous', help='keep taking orders that beat the reference price by --margin', action='store_true')
+parser.add_argument('--config', help='with --continuous, take in every market of this JSON config file (see README)')
+parser.add_argument('--margin', help='how far, as a fraction, an order must beat the reference price (default=0.02)', default=0.02)
+parser.add_argument('--maxsize', help='largest order to take, in maker (default=any)', default=None)
+parser.add_argument('--minbalance', help='min balance to keep of the asset paid for a take (default=0)', default=0)
+parser.add_argument('--side', help='asks (buy maker), bids (sell maker) or both (default=both)', default='both')
+parser.add_argument('--delay', help='seconds between order book polls (default=1)', default=None)
+parser.add_argument('--maxpending', help='max swaps from takes in progress at once (default=2)', default=None)
+parser.add_argument('--maxtakes', help='max orders taken per poll (default=1)', default=None)
+parser.add_argument('--dryrun', help='check takes with the wallet without taking', action='store_true')
+parser.add_argument('--usecb', help='enable cryptobridge pricing', action='store_true')
+parser.add_argument('--usecg', help='enable coingecko pricing', action='store_true')
+parser.add_argument('--usecustom', help='enable custom pricing', action='store_true')
+parser.add_argument('--useagg', help='enable aggregate pricing from all sources in dxsettings.pricesources', action='store_true')
+parser.add_argument('--usefeed', help='read prices from the pricefeed.py daemon, which prices from the source the other pricing flags pick (default=dxsettings.feedsource)', action='store_true')
+parser.add_argument('--pricettl', help='seconds a fetched price is reused before refreshing it in the background (default=10)', default=None)
+parser.add_argument('--metricsport', help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default=off)', default=None)
+parser.add_argument('--verbosity', help='quiet (warnings), loop (one line per loop) or debug (every step) (default=loop)', default='loop')
+parser.add_argument('--logfile', help='JSON lines log file, rotated by size (default=botdebug.log)', default=botlog.LOGFILE)
+parser.add_argument('--logmaxbytes', help='log file size that starts a new file (default=10485760)', default=botlog.MAXBYTES)
+parser.add_argument('--logbackups', help='rotated log files kept (default=5)', default=botlog.BACKUPS)
 args = parser.parse_args()
 
+try:
+  botlog.setup(args.logfile, args.verbosity, args.logmaxbytes, args.logbackups)
+except ValueError as e:
+  print('ERROR: {}'.format(e))
+  sys.exit(1)
 
-def takeorder(id, fromaddr, toaddr):
+
+def takeorder(orderid, fromaddr, toaddr):
   results = dxbottools.takeorder(orderid, fromaddr, toaddr)
   return results
 
 
-dxmaker = args.maker
-dxtaker = args.taker
+dxmaker = args.maker.upper()
+dxtaker = args.taker.upper()
+
+if args.continuous:
+  # only the continuous mode needs the pricing and engine modules
+  from utils import getpricing as pricebot
+  from utils import takerengine
+  from utils import metrics
+
+  if args.useagg:
+    BOTuse = 'agg'
+  elif args.usecustom:
+    BOTuse = 'custom'
+  elif args.usecg:
+    BOTuse = 'cg'
+  elif args.usecb:
+    BOTuse = 'cb'
+  else:
+    BOTuse = 'bt'
+  if args.usefeed:
+    if args.useagg or args.usecustom or args.usecg or args.usecb:
+      pricebot.feedsource = BOTuse
+    BOTuse = 'feed'
+  if args.pricettl:
+    pricebot.pricecache.ttl = float(args.pricettl)
+  BOTdelay = float(args.delay) if args.delay else takerengine.DELAY
+  BOTmaxpending = int(args.maxpending) if args.maxpending else takerengine.MAXPENDING
+  BOTmaxtakes = int(args.maxtakes) if args.maxtakes else takerengine.MAXTAKES
+
+  print('>>>> Start taker bot')
+  try:
+    if args.config:
+      config, markets = takerengine.loadconfig(args.config)
+      BOTuse = config.get('price', BOTuse)
+      BOTdelay = config.get('delay', BOTdelay)
+      BOTmaxpending = config.get('maxpending', BOTmaxpending)
+      BOTmaxtakes = config.get('maxtakes', BOTmaxtakes)
+    else:
+      markets = [takerengine.TakerMarket(dxmaker, dxtaker, margin=args.margin, maxsize=args.maxsize,
+                                         minbalance=args.minbalance, side=args.side)]
+  except (KeyError, ValueError, TypeError, OSError) as e:
+    print('ERROR: {}'.format(e))
+    sys.exit(1)
+  print(', '.join(str(market) for market in markets))
 
-asks, bids = dxbottools.getorderbook(dxmaker, dxtaker)
+  if args.metricsport:
+    metrics.serve(args.metricsport)
+    print('>>>> Metrics on http://127.0.0.1:{}/metrics'.format(args.metricsport))
 
-bestbidpriceorder = dxbottools.gethighprice(bids)
-bestaskpriceorder = dxbottools.getlowprice(asks)
+  engine = takerengine.TakerEngine(markets, BOTuse, BOTdelay, BOTmaxpending, BOTmaxtakes, args.dryrun)
+  print('>>>> Checking pricing information')
+  try:
+    priced = engine.checkprices()
+  except Exception as e:
+    print('ERROR: pricing failed: {}'.format(e))
+    sys.exit(1)
+  if not priced:
+    print('#### Pricing not available')
+    sys.exit(1)
+  engine.run()
+
+book = dxbottools.OrderBook(dxmaker, dxtaker)
+book.refresh()
+
+bestbidpriceorder = book.bestbid()
+bestaskpriceorder = book.bestask()
 # get order id from "asks" side
 buyingorders = bool(random.getrandbits(1))
+if buyingorders and bestaskpriceorder is None or not buyingorders and bestbidpriceorder is None:
+  print('#### No {} orders in market {}-{}'.format('ask' if buyingorders else 'bid', dxmaker, dxtaker))
+  sys.exit(1)
 if buyingorders:
   orderid = bestaskpriceorder[2]
   results = takeorder(orderid, dxsettings.tradingaddress[dxtaker], dxsettings.tradingaddress[dxmaker])
@@ -35,4 +124,3 @@ else:
   results = takeorder(orderid, dxsettings.tradingaddress[dxmaker], dxsettings.tradingaddress[dxtaker])
 
 print(results)
-
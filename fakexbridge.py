@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from utils import dxsettings
+from utils.fakexbridge import FakeXBridge, FakeXBridgeServer
+
+parser = argparse.ArgumentParser(description='local stand-in for the wallet XBridge RPC, for testing and load testing the bots offline')
+parser.add_argument('--host', help='address to listen on (default=127.0.0.1)', default='127.0.0.1')
+parser.add_argument('--port', help='port to listen on (default=dxsettings.rpcport)', default=dxsettings.rpcport)
+parser.add_argument('--balance', help='starting balance as ASSET=AMOUNT, repeatable (default=BLOCK=1000 LTC=100)', action='append')
+parser.add_argument('--seed', help='add other makers\' orders as MAKER-TAKER:PRICE:COUNT, repeatable (eg. BLOCK-LTC:0.02:100)', action='append', default=[])
+parser.add_argument('--fillrate', help='chance an open order of mine gets filled on each dxGetMyOrders (default=0)', default=0)
+parser.add_argument('--latency', help='seconds added to every request (default=0)', default=0)
+parser.add_argument('--jitter', help='random +/- seconds added on top of latency (default=0)', default=0)
+parser.add_argument('--errorrate', help='fraction of calls answered with an RPC error (default=0)', default=0)
+parser.add_argument('--droprate', help='fraction of requests whose connection is closed without an answer (default=0)', default=0)
+parser.add_argument('--noauth', help='accept requests without dxsettings.rpcuser/rpcpassword', action='store_true')
+args = parser.parse_args()
+
+balances = {}
+for balance in args.balance or ['BLOCK=1000', 'LTC=100']:
+    asset, value = balance.split('=')
+    balances[asset.upper()] = value
+
+wallet = FakeXBridge(balances, float(args.fillrate))
+for seed in args.seed:
+    try:
+        market, price, count = seed.split(':')
+        maker, taker = market.upper().split('-')
+        wallet.seed(maker, taker, float(price), int(count))
+    except ValueError:
+        print('ERROR: bad --seed {}, expected MAKER-TAKER:PRICE:COUNT'.format(seed))
+        sys.exit(1)
+
+server = FakeXBridgeServer((args.host, int(args.port)), wallet,
+                           rpcuser=None if args.noauth else dxsettings.rpcuser,
+                           rpcpassword=dxsettings.rpcpassword,
+                           latency=float(args.latency), jitter=float(args.jitter),
+                           errorrate=float(args.errorrate), droprate=float(args.droprate))
+print('>>>> Fake XBridge listening on {}:{}'.format(args.host, args.port))
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    print('>>>> {} requests, {} calls'.format(server.requests, server.calls))
+    server.server_close()
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
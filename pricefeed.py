@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import threading
+from utils import dxsettings
+from utils import botlog
+from utils import getpricing as pricebot
+from utils import pricefeed
+
+parser = argparse.ArgumentParser(description='polls prices once for every bot on this machine and serves them over a Unix socket (--usefeed)')
+parser.add_argument('--socket', help='Unix socket to serve on (default=dxsettings.feedsocket or pricefeed.sock)', default=getattr(dxsettings, 'feedsocket', pricebot.FEED_SOCKET))
+parser.add_argument('--sources', help='comma separated price sources to serve: cg, custom, cb, bt, agg (default=cg)', default='cg')
+parser.add_argument('--assets', help='comma separated assets to poll from the start, the ones bots ask for are added (default=none)', default='')
+parser.add_argument('--interval', help='seconds between polls of every asset (default=10)', default=pricefeed.INTERVAL)
+parser.add_argument('--metricsport', help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default=off)', default=None)
+parser.add_argument('--verbosity', help='quiet (warnings), loop (startup) or debug (every price lookup) (default=loop)', default='loop')
+parser.add_argument('--logfile', help='JSON lines log file, rotated by size (default=pricefeed.log)', default='pricefeed.log')
+args = parser.parse_args()
+
+try:
+    botlog.setup(args.logfile, args.verbosity)
+except ValueError as e:
+    print('ERROR: {}'.format(e))
+    sys.exit(1)
+
+sources = [source.strip() for source in args.sources.split(',') if source.strip()]
+for source in sources:
+    if source not in pricebot.PRICE_SOURCES + ('agg',):
+        print('ERROR: unknown price source: {}'.format(source))
+        sys.exit(1)
+
+feed = pricefeed.PriceFeed(sources, float(args.interval))
+assets = [asset.strip().upper() for asset in args.assets.split(',') if asset.strip()]
+for source in sources:
+    feed.subscribe(assets, source)
+
+if args.metricsport:
+    from utils import metrics
+    metrics.serve(args.metricsport)
+    print('>>>> Metrics on http://127.0.0.1:{}/metrics'.format(args.metricsport))
+
+try:
+    server = pricefeed.FeedServer(args.socket, feed)
+except OSError as e:
+    print('ERROR: {}'.format(e.strerror or e))
+    sys.exit(1)
+threading.Thread(target=feed.run, daemon=True).start()
+print('>>>> Price feed for {} every {}s on {}'.format(', '.join(sources), args.interval, args.socket))
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    print('>>>> {} polls'.format(feed.polls))
+finally:
+    server.server_close()
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,20 @@
+import pytest
+
+from utils import dxbottools, dxsettings
+from utils.fakexbridge import FakeXBridge, FakeXBridgeServer
+
+
+@pytest.fixture
+def fakexbridge():
+    # a fake XBridge wallet on a free port, with dxbottools pointed at it
+    wallet = FakeXBridge({'BLOCK': 1000, 'LTC': 100})
+    server = FakeXBridgeServer(('127.0.0.1', 0), wallet, rpcuser=dxsettings.rpcuser,
+                               rpcpassword=dxsettings.rpcpassword)
+    server.start()
+    dxbottools.connect(port=server.server_address[1])
+    dxbottools.orderstore = dxbottools.OrderStore()
+    yield server
+    server.shutdown()
+    server.server_close()
+    dxbottools.connect()
+    dxbottools.orderstore = dxbottools.OrderStore()
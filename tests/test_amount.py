@@ -0,0 +1,85 @@
+import random
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_UP
+
+import pytest
+
+from utils.amount import Amount, divround, parsedecimal, ratio
+from utils import ladder
+
+
+def test_divround():
+    # half to even, and 'up'/'down' towards +/- infinity
+    assert [divround(n, 2) for n in (1, 3, 5, -1, -3)] == [0, 2, 2, 0, -2]
+    assert divround(7, 3) == 2 and divround(8, 3) == 3
+    assert divround(7, 3, 'up') == 3 and divround(-7, 3, 'up') == -2
+    assert divround(8, 3, 'down') == 2 and divround(-7, 3, 'down') == -3
+    assert divround(6, 3, 'up') == 2
+    with pytest.raises(ValueError):
+        divround(7, 3, 'nearest')
+
+
+def test_parsedecimal():
+    assert parsedecimal('0.00123') == (123, 100000)
+    assert parsedecimal('-5') == (-5, 1)
+    assert parsedecimal('+5') == (5, 1)
+    assert parsedecimal('1e-07') == (1, 10 ** 7)
+    assert parsedecimal('-1.5E3') == (-1500, 1)
+    assert parsedecimal('.5') == (5, 10)
+    assert parsedecimal('2.5e+2') == (250, 1)
+    for bad in ('abc', '', '-', '1.2.3', '--5.1', '1e'):
+        with pytest.raises(ValueError):
+            parsedecimal(bad)
+
+
+def test_parse():
+    assert str(Amount.parse('250.000000', 6)) == '250.000000'
+    assert str(Amount.parse('1.2345675', 6)) == '1.234568'
+    assert str(Amount.parse('1.2345665', 6)) == '1.234566'
+    assert str(Amount.parse('1.2345661', 6, 'up')) == '1.234567'
+    assert str(Amount.parse(0.1, 6)) == '0.100000'
+    assert str(Amount.parse(1e-07, 8)) == '0.00000010'
+    assert str(Amount.parse(10, 2)) == '10.00'
+    assert str(Amount.parse('-0.5', 6)) == '-0.500000'
+    assert str(Amount.parse(Decimal('1E-7'), 8)) == '0.00000010'
+    assert str(Amount.parse(Amount.parse('1.25', 2), 1)) == '1.2'
+
+
+def test_convert_and_arithmetic():
+    assert Amount.parse('1', 6).convert(0.1, 6, 'up').units == 100000
+    # 2 * 0.0123 * 1.01 = 0.024846 exactly, no float error to round up
+    assert str(Amount.parse('2', 6).convert(ratio(0.0123, 1.01), 8, 'up')) == '0.02484600'
+    assert str(Amount.parse('1', 6).convert((1, 3), 2)) == '0.33'
+    assert str(Amount.parse('1', 6).convert((1, 3), 2, 'up')) == '0.34'
+    assert str(Amount.parse('1.000001', 6).convert(1, 2, 'up')) == '1.01'
+    assert Amount.parse('1.0', 6) == Amount.parse('1.000', 3)
+    assert Amount.parse('1', 6) > 0 and not Amount.parse('0', 6)
+    assert str(Amount.parse('1.5', 6) + Amount.parse('0.25', 2)) == '1.750000'
+    assert sum([Amount.parse('1', 6), Amount.parse('2', 6)]) == 3
+
+
+def decimalladder(marketprice, levels, sellmin, sellmax, slidemin, slidemax, distribution,
+                  makerdecimals, takerdecimals):
+    # the ladder worked out with Decimal, sells rounded half to even and
+    # buys rounded up
+    slides = ladder.spread(float(slidemin), float(slidemax), levels, distribution)
+    sizes = ladder.spread(float(sellmin), float(sellmax), levels, distribution)
+    makerstep = Decimal(1).scaleb(-makerdecimals)
+    takerstep = Decimal(1).scaleb(-takerdecimals)
+    price = Decimal(repr(float(marketprice)))
+    orders = []
+    for slide, size in zip(slides, sizes):
+        sell = Decimal(repr(size)).quantize(makerstep, rounding=ROUND_HALF_EVEN)
+        buy = (sell * price * Decimal(repr(slide))).quantize(takerstep, rounding=ROUND_UP)
+        if sell > 0 and buy > 0:
+            orders.append((str(sell), str(buy)))
+    return orders
+
+
+def test_ladder_matches_decimal():
+    rng = random.Random(1)
+    for i in range(2000):
+        args = (rng.choice([rng.uniform(1e-9, 1e4), round(rng.uniform(0, 10), 3)]), rng.randint(1, 8),
+                rng.uniform(0.0001, 10), rng.uniform(10, 1000), 1.001, rng.uniform(1.01, 1.2),
+                rng.choice(['linear', 'geometric']), rng.choice([2, 6, 8]), rng.choice([2, 6, 8]))
+        built = [(str(sell), str(buy)) for sell, buy in ladder.buildladder(*args)]
+        assert built == decimalladder(*args), args
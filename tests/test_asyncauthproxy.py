@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from utils import dxsettings
+from utils.asyncauthproxy import AsyncAuthServiceProxy, ConnectionLost
+from utils.fakexbridge import FakeXBridge, FakeXBridgeServer
+
+
+class DropOnceServer(FakeXBridgeServer):
+    # closes the connection without an answer on the second request only
+    @property
+    def droprate(self):
+        return 1.0 if self.requests == 2 else 0.0
+
+    @droprate.setter
+    def droprate(self, value):
+        pass
+
+
+@pytest.fixture
+def dropserver():
+    wallet = FakeXBridge({'BLOCK': 1000, 'LTC': 100})
+    server = DropOnceServer(('127.0.0.1', 0), wallet, rpcuser=dxsettings.rpcuser,
+                            rpcpassword=dxsettings.rpcpassword)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def pipelined(server, calls):
+    # calls written back to back on one connection, results or exceptions
+    async def run():
+        proxy = AsyncAuthServiceProxy('http://{}:{}@127.0.0.1:{}'.format(
+            dxsettings.rpcuser, dxsettings.rpcpassword, server.server_address[1]),
+            pool_size=1, pipeline_depth=len(calls))
+        try:
+            return await asyncio.gather(*[getattr(proxy, call[0])(*call[1:]) for call in calls],
+                                        return_exceptions=True)
+        finally:
+            await proxy.close()
+    return asyncio.run(run())
+
+
+def test_writes_are_not_resent_after_a_drop(dropserver):
+    order = ['dxMakeOrder', 'BLOCK', '1.000000', 'a', 'LTC', '0.010000', 'b']
+    results = pipelined(dropserver, [order] * 4)
+    lost = [result for result in results if isinstance(result, ConnectionLost)]
+    assert isinstance(results[0], dict) and len(lost) == 3
+    # only the order that was answered exists
+    assert len(dropserver.wallet.mine) == 1
+
+
+def test_reads_are_resent_after_a_drop(dropserver):
+    results = pipelined(dropserver, [['dxGetTokenBalances']] * 4)
+    assert results == [{'BLOCK': '1000.000000', 'LTC': '100.000000'}] * 4
@@ -0,0 +1,93 @@
+import socket
+import time
+
+import pytest
+
+from utils import dxsettings
+from utils.authproxy import AuthServiceProxy
+from utils.fakexbridge import FakeXBridge, FakeXBridgeHandler, FakeXBridgeServer
+
+ORDER = ['BLOCK', '1.000000', 'a', 'LTC', '0.010000', 'b']
+
+
+class HangUpHandler(FakeXBridgeHandler):
+    # hangs up every connection after answering, without a Connection: close
+    # header, like a wallet whose keep-alive timeout ran out. the socket is
+    # only shut for writing for a while, so a request sent on it goes out
+    # whole and is never answered
+    def do_POST(self):
+        FakeXBridgeHandler.do_POST(self)
+        self.connection.shutdown(socket.SHUT_WR)
+        time.sleep(0.5)
+        self.close_connection = True
+
+
+class DropSecondServer(FakeXBridgeServer):
+    # closes the connection without an answer on the second request only
+    @property
+    def droprate(self):
+        return 1.0 if self.requests == 2 else 0.0
+
+    @droprate.setter
+    def droprate(self, value):
+        pass
+
+
+def connect(server):
+    return AuthServiceProxy('http://{}:{}@127.0.0.1:{}'.format(
+        dxsettings.rpcuser, dxsettings.rpcpassword, server.server_address[1]), pool_size=1)
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(cls, handler=None):
+        server = cls(('127.0.0.1', 0), FakeXBridge({'BLOCK': 1000, 'LTC': 100}),
+                     rpcuser=dxsettings.rpcuser, rpcpassword=dxsettings.rpcpassword)
+        if handler is not None:
+            server.RequestHandlerClass = handler
+        server.start()
+        started.append(server)
+        return server, connect(server)
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_write_skips_a_connection_the_wallet_closed(servers):
+    server, proxy = servers(FakeXBridgeServer, HangUpHandler)
+    proxy.dxGetTokenBalances()
+    time.sleep(0.1)
+    assert proxy.dxMakeOrder(*ORDER)['status'] == 'open'
+    assert len(server.wallet.mine) == 1
+    assert server.requests == 2
+
+
+def test_read_is_resent_on_a_fresh_connection(servers):
+    server, proxy = servers(DropSecondServer)
+    proxy.dxGetTokenBalances()
+    assert proxy.dxGetMyOrders() == []
+    assert server.requests == 3
+
+
+def test_write_is_not_resent_once_sent(servers):
+    server, proxy = servers(DropSecondServer)
+    proxy.dxGetTokenBalances()
+    with pytest.raises(ConnectionError):
+        proxy.dxMakeOrder(*ORDER)
+    assert server.requests == 2
+    # the next call gets a fresh connection
+    assert proxy.dxMakeOrder(*ORDER)['status'] == 'open'
+
+
+def test_batch_is_resent_only_if_every_call_reads(servers):
+    server, proxy = servers(DropSecondServer)
+    proxy.dxGetTokenBalances()
+    assert len(proxy.batch_([['dxGetTokenBalances'], ['dxGetMyOrders']])) == 2
+    server, proxy = servers(DropSecondServer)
+    proxy.dxGetTokenBalances()
+    with pytest.raises(ConnectionError):
+        proxy.batch_([['dxGetTokenBalances'], ['dxMakeOrder'] + ORDER])
+    assert server.requests == 2
@@ -0,0 +1,59 @@
+import time
+
+from utils import dxbottools
+
+
+def losefirstcancel(server):
+    # the first dxCancelOrder is carried out, then its connection dropped
+    # instead of answered
+    call = server.call
+    lost = []
+
+    def losing(request):
+        response = call(request)
+        if request.get('method') == 'dxCancelOrder' and not lost:
+            lost.append(request)
+            raise ConnectionAbortedError('answer lost')
+        return response
+    server.call = losing
+
+
+def placeorders(count):
+    return [dxbottools.makeorder('BLOCK', '1.000000', 'a', 'LTC', '0.010000', 'b')['id'] for i in range(count)]
+
+
+def test_cancels_every_order(fakexbridge):
+    orderids = placeorders(5)
+    report = dxbottools.cancelorders(orderids, rate=100, workers=2)
+    assert sorted(report) == sorted(orderids)
+    assert all(result['status'] == 'canceled' for result in report.values())
+    assert all(fakexbridge.wallet.orders[oid]['status'] == 'canceled' for oid in orderids)
+
+
+def test_cancel_rate(fakexbridge):
+    orderids = placeorders(6)
+    start = time.monotonic()
+    dxbottools.cancelorders(orderids, rate=10, workers=1)
+    # 6 cancels at 10 per second, the first right away
+    assert time.monotonic() - start >= 0.45
+
+
+def test_rate_limiter_burst():
+    limiter = dxbottools.RateLimiter(10, burst=3)
+    delays = [limiter.reserve() for i in range(5)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert 0.05 < delays[3] <= 0.1 and 0.15 < delays[4] <= 0.2
+
+
+def test_lost_cancel_answer_counts_as_canceled(fakexbridge):
+    losefirstcancel(fakexbridge)
+    orderid = placeorders(1)[0]
+    report = dxbottools.cancelorders([orderid], rate=100, workers=1)
+    assert report[orderid]['status'] == 'canceled'
+    assert report[orderid]['attempts'] == 2
+
+
+def test_unknown_order_fails(fakexbridge):
+    report = dxbottools.cancelorders(['f' * 64], rate=100, workers=1, retries=1)
+    assert report['f' * 64]['status'] == 'failed'
+    assert report['f' * 64]['attempts'] == 2
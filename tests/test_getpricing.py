@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+from utils import custompricing, dxsettings
+from utils import getpricing as pricebot
+
+
+def test_unbatched_assets_are_fetched_together(monkeypatch):
+    def slowprice(marketname, source):
+        time.sleep(0.3)
+        return 0.001
+    monkeypatch.setattr(pricebot, 'getmarketprice', slowprice)
+    cache = pricebot.PriceCache()
+    start = time.time()
+    prices = cache.fetch(['BLOCK', 'LTC', 'SYS', 'MUE'], 'agg')
+    assert time.time() - start < 0.6
+    assert prices == {'BLOCK': 0.001, 'LTC': 0.001, 'SYS': 0.001, 'MUE': 0.001}
+
+
+def test_failed_asset_keeps_the_others(monkeypatch):
+    def someprice(marketname, source):
+        if marketname == 'BTC-SYS':
+            raise RuntimeError('no SYS price')
+        return 0.001
+    monkeypatch.setattr(pricebot, 'getmarketprice', someprice)
+    cache = pricebot.PriceCache()
+    with pytest.raises(RuntimeError):
+        cache.fetch(['BLOCK', 'SYS', 'LTC'], 'bt')
+    assert sorted(cache.quotes(['BLOCK', 'SYS', 'LTC'], 'bt')) == ['BLOCK', 'LTC']
+
+
+def test_custom_failure_raises_and_serves_stale(monkeypatch):
+    def failing(asset, endpoint):
+        raise RuntimeError('endpoint down')
+    monkeypatch.setattr(dxsettings, 'apiendpoint', {'BLOCK': 'http://127.0.0.1:9/'}, raising=False)
+    monkeypatch.setattr(custompricing, 'getprice', lambda asset, endpoint: 0.002)
+    cache = pricebot.PriceCache(ttl=0, maxstale=60)
+    assert cache.get('BLOCK', 'custom') == 0.002
+    monkeypatch.setattr(custompricing, 'getprice', failing)
+    with pytest.raises(RuntimeError):
+        pricebot.getmarketprice('BTC-BLOCK', 'custom')
+    # past its ttl the last good price is served while the refresh fails
+    assert cache.get('BLOCK', 'custom') == 0.002
+
+
+def countingprice(monkeypatch, prices):
+    # getmarketprice answering from prices, returns the list of calls
+    calls = []
+
+    def price(marketname, source):
+        calls.append(marketname)
+        value = prices[marketname.split('-')[1]]
+        if isinstance(value, Exception):
+            raise value
+        return value
+    monkeypatch.setattr(pricebot, 'getmarketprice', price)
+    return calls
+
+
+def waitfor(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_cache_serves_within_ttl(monkeypatch):
+    calls = countingprice(monkeypatch, {'BLOCK': 0.001})
+    cache = pricebot.PriceCache(ttl=60, maxstale=120)
+    assert cache.get('BLOCK', 'bt') == 0.001
+    assert cache.get('BLOCK', 'bt') == 0.001
+    assert calls == ['BTC-BLOCK']
+
+
+def test_cache_serves_stale_while_refreshing(monkeypatch):
+    prices = {'BLOCK': 0.001}
+    calls = countingprice(monkeypatch, prices)
+    cache = pricebot.PriceCache(ttl=0.05, maxstale=120)
+    cache.get('BLOCK', 'bt')
+    time.sleep(0.1)
+    prices['BLOCK'] = 0.002
+    # the old price is served right away, the new one once the refresh is in
+    assert cache.get('BLOCK', 'bt') == 0.001
+    assert waitfor(lambda: cache.quotes(['BLOCK'], 'bt')['BLOCK'][0] == 0.002)
+    assert len(calls) == 2
+
+
+def test_cache_stops_serving_past_maxstale(monkeypatch):
+    prices = {'BLOCK': 0.001}
+    countingprice(monkeypatch, prices)
+    cache = pricebot.PriceCache(ttl=0.01, maxstale=0.1)
+    cache.get('BLOCK', 'bt')
+    prices['BLOCK'] = RuntimeError('source down')
+    time.sleep(0.05)
+    assert cache.get('BLOCK', 'bt') == 0.001
+    time.sleep(0.1)
+    assert cache.get('BLOCK', 'bt') == 0
+
+
+def fakesources(monkeypatch, quotes):
+    # getsourceprice answering from quotes {source: (seconds, price)}
+    def price(asset, source):
+        seconds, value = quotes[source]
+        time.sleep(seconds)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    monkeypatch.setattr(pricebot, 'getsourceprice', price)
+
+
+def test_aggregate_waits_no_longer_than_the_deadline(monkeypatch):
+    fakesources(monkeypatch, {'a': (0, 1.0), 'b': (0, 1.02), 'c': (1.0, 5.0)})
+    start = time.time()
+    assert pricebot.getaggregateprice('BLOCK', sources=('a', 'b', 'c'), deadline=0.2, rule='median') == 1.01
+    assert time.time() - start < 0.5
+
+
+def test_aggregate_drops_outliers_and_failures(monkeypatch):
+    fakesources(monkeypatch, {'a': (0, 1.0), 'b': (0, 1.01), 'c': (0, 0.99), 'd': (0, 2.0),
+                              'e': (0, RuntimeError('down'))})
+    assert pricebot.getaggregateprice('BLOCK', sources=('a', 'b', 'c', 'd', 'e'), deadline=1,
+                                      rule='median', maxdeviation=0.05) == 1.0
+    assert pricebot.getaggregateprice('BLOCK', sources=('a', 'b'), deadline=1, rule='weighted',
+                                      weights={'a': 3, 'b': 1}) == pytest.approx(1.0025)
+
+
+def test_aggregate_first_and_no_quotes(monkeypatch):
+    fakesources(monkeypatch, {'a': (0.3, 1.0), 'b': (0, 1.05), 'c': (0.5, 0)})
+    assert pricebot.getaggregateprice('BLOCK', sources=('a', 'b'), deadline=1, rule='first') == 1.05
+    assert pricebot.getaggregateprice('BLOCK', sources=('c',), deadline=0.1) == 0
@@ -0,0 +1,69 @@
+from utils import dxbottools
+from utils.journal import Journal
+from utils.makerengine import MakerEngine, MarketMaker
+
+
+def maker():
+    return MarketMaker('BLOCK', 'LTC', sellmin=1, sellmax=2, minbalance=0, maxopen=3, maxage=3600)
+
+
+def restart(path):
+    # a fresh bot on the journal, as after a restart
+    market = maker()
+    engine = MakerEngine([market], 'bt', 1, journal=Journal(path))
+    return engine, market
+
+
+def test_restore_picks_up_open_orders(fakexbridge, tmp_path):
+    path = str(tmp_path / 'journal.db')
+    engine, market = restart(path)
+    for i in range(3):
+        market.step(dxbottools.getsnapshot(), 0.01)
+    orderids = [row['id'] for row in engine.journal.openorders()]
+    assert len(orderids) == 3
+    # one order is canceled while the bot is stopped
+    fakexbridge.wallet.dxCancelOrder(orderids[0])
+
+    engine, market = restart(path)
+    assert engine.restore() == {'open': 2, 'closed': 1, 'unknown': 0}
+    assert market.lastprice == 0.01 and market.ordercount == 2
+    assert engine.journal.events(orderids[0])[-1]['event'] == 'canceled'
+    # the price did not move, the first pass keeps the orders and tops up
+    market.step(dxbottools.getsnapshot(), 0.01)
+    assert 'price' not in market.report['events']
+    assert len(engine.journal.openorders()) == 3
+    assert all(fakexbridge.wallet.orders[oid]['status'] == 'open' for oid in orderids[1:])
+
+
+def test_restore_requotes_orders_with_no_known_price(fakexbridge, tmp_path):
+    path = str(tmp_path / 'journal.db')
+    # an order placed by hand, the journal has never seen it
+    orderid = dxbottools.makeorder('BLOCK', '1.000000', 'a', 'LTC', '0.010000', 'b')['id']
+    engine, market = restart(path)
+    assert engine.restore() == {'open': 0, 'closed': 0, 'unknown': 1}
+    market.step(dxbottools.getsnapshot(), 0.01)
+    assert 'price' in market.report['events']
+    assert fakexbridge.wallet.orders[orderid]['status'] == 'canceled'
+
+
+def test_restore_moved_price_requotes(fakexbridge, tmp_path):
+    path = str(tmp_path / 'journal.db')
+    engine, market = restart(path)
+    market.step(dxbottools.getsnapshot(), 0.01)
+    orderid = engine.journal.openorders()[0]['id']
+    engine, market = restart(path)
+    engine.restore()
+    market.step(dxbottools.getsnapshot(), 0.02)
+    assert fakexbridge.wallet.orders[orderid]['status'] == 'canceled'
+    assert engine.journal.events(orderid)[-1]['event'] == 'canceled'
+
+
+def test_reconcile_settles_only_its_markets(tmp_path):
+    journal = Journal(str(tmp_path / 'journal.db'))
+    journal.placed('BLOCK-LTC', {'id': 'a', 'maker_size': '1', 'taker_size': '0.01'}, 0.01)
+    journal.placed('SYS-LTC', {'id': 'b', 'maker_size': '1', 'taker_size': '0.01'}, 0.01)
+    # b was placed by another bot sharing the journal after the wallet was read
+    myorders = [{'id': 'a', 'status': 'open', 'maker': 'BLOCK', 'taker': 'LTC'}]
+    assert journal.reconcile(myorders, {'BLOCK-LTC'}) == {'open': 1, 'closed': 0, 'unknown': 0}
+    assert sorted(row['id'] for row in journal.openorders()) == ['a', 'b']
+    assert journal.reconcile(myorders) == {'open': 1, 'closed': 1, 'unknown': 0}
@@ -0,0 +1,62 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+from utils.authproxy import JSONCodec, JSONRPCException
+
+ORDERS = [{'id': 'a' * 64, 'maker': 'BLOCK', 'maker_size': 12.5, 'taker': 'LTC', 'taker_size': 0.0123,
+           'status': 'open', 'note': 'café ✓'},
+          {'id': 'b' * 64, 'maker': 'LTC', 'maker_size': 1000, 'taker': 'BLOCK', 'taker_size': 1e-07,
+           'status': 'canceled', 'nested': [1, [2, {'x': None}], True, False]}]
+
+
+def splits(body):
+    # the body cut in two at every byte boundary
+    for i in range(len(body) + 1):
+        yield [body[:i], body[i:]]
+
+
+def test_iterresult_split_at_every_byte():
+    codec = JSONCodec()
+    body = json.dumps({'result': ORDERS, 'error': None, 'id': 7}).encode('utf8')
+    expected = codec.decode(body)['result']
+    for chunks in splits(body):
+        assert list(codec.iterresult(chunks)) == expected
+
+
+def test_iterresult_one_byte_chunks():
+    codec = JSONCodec()
+    body = json.dumps({'id': 7, 'error': None, 'result': ORDERS}).encode('utf8')
+    items = list(codec.iterresult(body[i:i + 1] for i in range(len(body))))
+    assert items == codec.decode(body)['result']
+    assert items[0]['taker_size'] == Decimal('0.0123')
+    assert items[0]['note'] == 'café ✓'
+
+
+def test_iterresult_error_split_at_every_byte():
+    codec = JSONCodec()
+    body = json.dumps({'result': None, 'error': {'code': 1024, 'message': 'bad ✓'}, 'id': 7}).encode('utf8')
+    for chunks in splits(body):
+        with pytest.raises(JSONRPCException) as e:
+            list(codec.iterresult(chunks))
+        assert e.value.code == 1024
+
+
+def test_iterresult_empty_and_not_an_array():
+    codec = JSONCodec()
+    for chunks in splits(b'{"result": [], "error": null, "id": 1}'):
+        assert list(codec.iterresult(chunks)) == []
+    with pytest.raises(JSONRPCException) as e:
+        list(codec.iterresult([b'{"result": {"a": 1}, "error": null}']))
+    assert e.value.code == -344
+    with pytest.raises(JSONRPCException) as e:
+        list(codec.iterresult([b'{"error": null}']))
+    assert e.value.code == -343
+
+
+def test_iterresult_truncated_body():
+    codec = JSONCodec()
+    body = json.dumps({'result': ORDERS, 'error': None}).encode('utf8')
+    with pytest.raises(ValueError):
+        list(codec.iterresult([body[:-10]]))
@@ -0,0 +1,61 @@
+import time
+from decimal import Decimal
+
+from utils import dxbottools
+from utils.makerengine import MarketMaker
+
+
+def locked(wallet, maker):
+    # maker funds in my open orders
+    return sum(Decimal(wallet.orders[oid]['maker_size']) for oid in wallet.mine
+               if wallet.orders[oid]['status'] == 'open' and wallet.orders[oid]['maker'] == maker)
+
+
+def test_minbalance_is_kept(fakexbridge):
+    wallet = fakexbridge.wallet
+    wallet.balances['BLOCK'] = Decimal(14)
+    market = MarketMaker('BLOCK', 'LTC', sellmin=1, sellmax=3, minbalance=10, maxopen=50, maxage=3600)
+    for i in range(20):
+        market.step(dxbottools.getsnapshot(), 0.01)
+    assert locked(wallet, 'BLOCK') > 0
+    assert wallet.balances['BLOCK'] >= 10
+    # at the floor no order is placed at all
+    placed = len(wallet.mine)
+    market.step(dxbottools.getsnapshot(), 0.01)
+    assert len(wallet.mine) == placed
+
+
+def test_minbalance_is_kept_by_ladders(fakexbridge):
+    wallet = fakexbridge.wallet
+    wallet.balances['BLOCK'] = Decimal(15)
+    market = MarketMaker('BLOCK', 'LTC', sellmin=1, sellmax=4, minbalance=10, maxopen=10, maxage=3600, ladder=5)
+    market.step(dxbottools.getsnapshot(), 0.01)
+    # levels of 1 and 1.75 fit in the 5 above the floor, the next of 2.5 does not
+    assert locked(wallet, 'BLOCK') == Decimal('2.75')
+    assert wallet.balances['BLOCK'] == Decimal('12.25')
+
+
+def test_zero_minbalance_places_orders(fakexbridge):
+    wallet = fakexbridge.wallet
+    market = MarketMaker('BLOCK', 'LTC', sellmin=1, sellmax=2, minbalance=0, maxopen=3, maxage=3600)
+    for i in range(3):
+        market.step(dxbottools.getsnapshot(), 0.01)
+    assert len(wallet.mine) == 3
+
+
+def test_fill_and_age_events(fakexbridge):
+    wallet = fakexbridge.wallet
+    market = MarketMaker('BLOCK', 'LTC', sellmin=1, sellmax=2, minbalance=0, maxopen=2, maxage=3600)
+    for i in range(3):
+        market.step(dxbottools.getsnapshot(), 0.01)
+    # nothing changed, nothing to do
+    assert not market.step(dxbottools.getsnapshot(), 0.01)
+    # a taker fills one order: the market sees it and replaces it
+    oid = sorted(market.lastopenids)[0]
+    with wallet.lock:
+        wallet._fill(wallet.orders[oid])
+    assert market.step(dxbottools.getsnapshot(), 0.01)
+    assert 'fill' in market.report['events'] and len(market.report['placed']) == 1
+    # past maxage the oldest order is canceled
+    market.step(dxbottools.getsnapshot(), 0.01, now=time.time() + 3601)
+    assert 'age' in market.report['events'] and market.report['canceled'] == 1
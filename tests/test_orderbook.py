@@ -0,0 +1,59 @@
+import random
+
+from utils import dxbottools
+
+
+def best(entries, sign):
+    # entries sorted best price first, ties by order id
+    return sorted(entries, key=lambda z: (sign * float(z[0]), z[2]))
+
+
+def brute(entries, amount, sign):
+    # depth and vwap of amount, walking the entries from the best price
+    size = cost = 0.0
+    for price, entrysize, oid in best(entries, sign):
+        take = min(float(entrysize), amount - size)
+        size += take
+        cost += take * float(price)
+        if size >= amount:
+            return price, cost / amount
+    return None, None
+
+
+def check(book, sign, side, entries):
+    assert side.entries == best(entries, sign)
+    for amount in (0.5, 10, 100, 1000, 10 ** 9):
+        depth, vwap = brute(entries, amount, sign)
+        assert side.depth(amount) == depth
+        if vwap is None:
+            assert side.vwap(amount) is None
+        else:
+            assert abs(side.vwap(amount) - vwap) < 1e-9 * vwap
+
+
+def test_orderbook_follows_the_wallet(fakexbridge):
+    random.seed(3)
+    wallet = fakexbridge.wallet
+    wallet.seed('BLOCK', 'LTC', 0.02, 60)
+    book = dxbottools.OrderBook('BLOCK', 'LTC')
+    for i in range(4):
+        book.refresh()
+        asks, bids = dxbottools.getorderbook('BLOCK', 'LTC')
+        check(book, 1, book.asks, asks)
+        check(book, -1, book.bids, bids)
+        assert book.bestask() == best(asks, 1)[0]
+        assert book.bestbid() == best(bids, -1)[0]
+        assert book.spread() == float(book.bestask()[0]) - float(book.bestbid()[0])
+        # some orders taken, a few new ones: the next refresh only applies the change
+        for z in random.sample(asks, 3) + random.sample(bids, 3):
+            dxbottools.takeorder(z[2], 'a', 'b')
+        wallet.seed('BLOCK', 'LTC', 0.02, 4)
+    assert book.refresh() > 0
+    assert book.refresh() == 0
+
+
+def test_empty_book(fakexbridge):
+    book = dxbottools.OrderBook('SYS', 'LTC')
+    assert book.refresh() == 0
+    assert book.bestask() is None and book.spread() is None
+    assert book.asks.depth(1) is None and book.bids.vwap(1) is None
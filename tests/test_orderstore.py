@@ -0,0 +1,70 @@
+from utils.dxbottools import OrderStore, getepochtime
+
+
+def order(oid, status='open', maker='BLOCK', taker='LTC', created='2018-09-17T17:33:44.876Z'):
+    return {'id': oid, 'status': status, 'maker': maker, 'taker': taker,
+            'maker_size': '1.000000', 'taker_size': '0.010000', 'created_at': created}
+
+
+def test_oldest_and_openorders():
+    store = OrderStore()
+    store.update([order('a', created='2018-09-17T17:33:46.000Z'),
+                  order('b', created='2018-09-17T17:33:44.000Z'),
+                  order('c', created='2018-09-17T17:33:45.000Z'),
+                  order('d', maker='LTC', taker='BLOCK'),
+                  order('e', status='canceled')])
+    assert store.oldest('BLOCK', 'LTC') == (getepochtime('2018-09-17T17:33:44.000Z'), 'b')
+    assert sorted(z['id'] for z in store.openorders('BLOCK', 'LTC')) == ['a', 'b', 'c']
+    assert sorted(z['id'] for z in store.openorders('BLOCK')) == ['a', 'b', 'c']
+    assert sorted(z['id'] for z in store.openorders()) == ['a', 'b', 'c', 'd']
+    assert store.oldest('SYS', 'LTC') is None
+    assert store.ismine('e') and not store.ismine('x')
+
+
+def test_orders_leaving_and_changing_status():
+    store = OrderStore()
+    store.update([order('a', created='2018-09-17T17:33:44.000Z'),
+                  order('b', created='2018-09-17T17:33:45.000Z'),
+                  order('c', created='2018-09-17T17:33:46.000Z')])
+    # a filled, b no longer reported
+    store.update([order('a', status='finished', created='2018-09-17T17:33:44.000Z'),
+                  order('c', created='2018-09-17T17:33:46.000Z')])
+    assert store.oldest('BLOCK', 'LTC') == (getepochtime('2018-09-17T17:33:46.000Z'), 'c')
+    assert [z['id'] for z in store.openorders('BLOCK', 'LTC')] == ['c']
+    assert list(store.bystatus['finished']) == ['a']
+    assert 'b' not in store.byid
+    # the last open order canceled
+    store.update([order('c', status='canceled', created='2018-09-17T17:33:46.000Z')])
+    assert store.oldest('BLOCK', 'LTC') is None
+    assert store.openorders('BLOCK', 'LTC') == []
+    assert store.openorders() == []
+
+
+def test_order_reopened_under_same_id():
+    store = OrderStore()
+    store.update([order('a', created='2018-09-17T17:33:44.000Z'), order('b', created='2018-09-17T17:33:45.000Z')])
+    store.update([order('a', status='canceled', created='2018-09-17T17:33:44.000Z'), order('b', created='2018-09-17T17:33:45.000Z')])
+    # its stale heap entry must not come back as the oldest
+    store.update([order('a', created='2018-09-17T17:33:44.000Z'), order('b', created='2018-09-17T17:33:45.000Z')])
+    assert store.oldest('BLOCK', 'LTC') == (getepochtime('2018-09-17T17:33:44.000Z'), 'a')
+    assert len(store.openorders('BLOCK', 'LTC')) == 2
+
+
+def test_same_result_is_not_reindexed():
+    store = OrderStore()
+    myorders = [order('a')]
+    store.update(myorders)
+    myorders.append(order('b'))
+    # the same list object is taken as already seen
+    store.update(myorders)
+    assert list(store.byid) == ['a']
+
+
+def test_heap_rebuilt_after_many_orders_come_and_go():
+    store = OrderStore()
+    for i in range(200):
+        created = '2018-09-17T17:{:02d}:{:02d}.000Z'.format(i // 60, i % 60)
+        store.update([order('keep', created='2018-09-17T18:00:00.000Z'), order(str(i), created=created)])
+    assert store.oldest('BLOCK', 'LTC') == (getepochtime('2018-09-17T17:03:19.000Z'), '199')
+    store.update([order('keep', created='2018-09-17T18:00:00.000Z')])
+    assert store.oldest('BLOCK', 'LTC') == (getepochtime('2018-09-17T18:00:00.000Z'), 'keep')
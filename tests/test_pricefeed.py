@@ -0,0 +1,42 @@
+import socket
+import threading
+
+import pytest
+
+from utils import pricefeed
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'feed.sock')
+
+
+def serve(path):
+    server = pricefeed.FeedServer(path, pricefeed.PriceFeed(['bt']))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_running_feed_keeps_its_socket(path):
+    server = serve(path)
+    try:
+        with pytest.raises(OSError, match='already serving'):
+            pricefeed.FeedServer(path, pricefeed.PriceFeed(['bt']))
+        # clients still reach the first feed
+        with pytest.raises(ValueError, match='not served'):
+            pricefeed.FeedClient(path, 'cg').get(['BLOCK'])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stale_socket_is_replaced(path):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = serve(path)
+    try:
+        assert pricefeed.FeedClient(path, 'bt').get(['BTC']) == {'BTC': 1.0}
+    finally:
+        server.shutdown()
+        server.server_close()
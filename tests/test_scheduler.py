@@ -0,0 +1,32 @@
+import threading
+import time
+
+from utils.scheduler import AdaptiveScheduler
+
+
+def test_backoff_and_reset():
+    scheduler = AdaptiveScheduler(1, 5)
+    delays = []
+    for active in (False, False, False, False, True):
+        scheduler.done(active)
+        delays.append(scheduler.delay)
+    assert delays == [2, 4, 5, 5, 1]
+
+
+def test_wake_returns_early_with_reasons():
+    scheduler = AdaptiveScheduler(5, 5)
+    threading.Timer(0.05, scheduler.wake, ('price BLOCK-LTC',)).start()
+    start = time.time()
+    assert scheduler.wait() == ['price BLOCK-LTC']
+    assert time.time() - start < 1
+    # reasons are handed out once
+    scheduler.delay = 0.01
+    assert scheduler.wait() == []
+
+
+def test_deadline_cuts_the_delay():
+    scheduler = AdaptiveScheduler(5, 5)
+    start = time.time()
+    assert scheduler.wait(time.time() + 0.05) == ['deadline']
+    assert time.time() - start < 1
+    assert scheduler.wait(time.time() - 1) == ['deadline']
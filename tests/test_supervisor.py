@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from utils import supervisor
+
+
+def market(maker, taker, endpoint=None):
+    entry = {'maker': maker, 'taker': taker}
+    if endpoint is not None:
+        entry['endpoint'] = endpoint
+    return entry
+
+
+CONFIG = {'delay': 3,
+          'endpoints': [{'name': 'a', 'port': 41414}, {'name': 'b', 'host': '10.0.0.2', 'port': 41415}],
+          'markets': [market('BLOCK', 'LTC'), market('BLOCK', 'BTC', 'a'), market('LTC', 'BLOCK', 'a'),
+                      market('SYS', 'LTC', 'a'), market('BLOCK', 'LTC', 'b')]}
+
+
+def names(shard):
+    return sorted('{}-{}'.format(entry['maker'], entry['taker']) for entry in shard['markets'])
+
+
+def test_shard_keeps_a_maker_asset_together():
+    shards = supervisor.shard(CONFIG, 3)
+    assert len(shards) == 3
+    for shard in shards:
+        assert shard['delay'] == 3 and 'endpoints' not in shard
+        assert all('endpoint' not in entry for entry in shard['markets'])
+    onb = [shard for shard in shards if shard['endpoint'].get('host') == '10.0.0.2']
+    assert [names(shard) for shard in onb] == [['BLOCK-LTC']]
+    # the BLOCK markets of endpoint a share a balance, so one worker
+    ona = sorted(names(shard) for shard in shards if shard not in onb)
+    assert ona == [['BLOCK-BTC', 'BLOCK-LTC'], ['LTC-BLOCK', 'SYS-LTC']]
+
+
+def test_shard_at_least_one_worker_per_endpoint():
+    assert len(supervisor.shard(CONFIG, 1)) == 2
+    # no more workers than maker groups
+    assert len(supervisor.shard(CONFIG, 10)) == 4
+
+
+def test_workers_on_an_endpoint_share_its_journal(tmp_path):
+    workers = [supervisor.Worker(i, shard, str(tmp_path)) for i, shard in enumerate(supervisor.shard(CONFIG, 4))]
+    journals = set(worker.journal for worker in workers)
+    assert journals == {str(tmp_path / 'journal-127.0.0.1-41414.db'), str(tmp_path / 'journal-10.0.0.2-41415.db')}
+
+
+def test_loadconfig_checks_endpoints(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(dict(CONFIG, markets=[market('BLOCK', 'LTC', 'c')])))
+    with pytest.raises(ValueError, match='unknown endpoint'):
+        supervisor.loadconfig(str(path))
+    path.write_text(json.dumps(dict(CONFIG, endpoints=[{'name': 'a'}, {'name': 'a'}])))
+    with pytest.raises(ValueError, match='unique'):
+        supervisor.loadconfig(str(path))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# fixed-point asset amounts. an Amount is an int count of base units of
+# 10**-decimals each, decimals being the places the wallet takes for the
+# asset. amounts parse from the wallet's strings, scale by prices and
+# format back for dxMakeOrder with int arithmetic only, so sizes never go
+# through float or Decimal and round exactly once, where asked to
+from utils import dxsettings
+
+DEFAULT_DECIMALS = 6 # what dxmakerbot.py has always formatted amounts with
+ROUNDINGS = ('even', 'up', 'down')
+
+# 10**n for every shift between two assets' decimals
+POWERS = [10 ** i for i in range(64)]
+
+
+def getdecimals(asset):
+    # decimal places the wallet takes for asset amounts
+    return getattr(dxsettings, 'assetdecimals', {}).get(asset, DEFAULT_DECIMALS)
+
+
+def divround(n, d, rounding='even'):
+    # n / d as an int, d > 0. 'even' rounds half to even, 'up' and 'down'
+    # towards +/- infinity
+    q, r = divmod(n, d)
+    if not r or rounding == 'down':
+        return q
+    if rounding == 'up':
+        return q + 1
+    if rounding != 'even':
+        raise ValueError('rounding must be one of {}'.format(', '.join(ROUNDINGS)))
+    r += r
+    return q + 1 if r > d or r == d and q & 1 else q
+
+
+def parsedecimal(s):
+    # (num, den) of a decimal string such as '0.00123', '-5' or '1e-07',
+    # den a power of 10
+    whole, dot, frac = s.partition('.')
+    if frac.isdigit() and whole.lstrip('-').isdigit():
+        return int(whole + frac), POWERS[len(frac)]
+    mantissa, e, exponent = s.strip().lower().partition('e')
+    whole, dot, frac = mantissa.partition('.')
+    if frac and not frac.isdigit() or whole + frac in ('', '-', '+'):
+        raise ValueError('not a decimal number: {!r}'.format(s))
+    num = int(whole + frac)
+    shift = (int(exponent) if e else 0) - len(frac)
+    if shift >= 0:
+        return num * POWERS[shift], 1
+    return num, POWERS[-shift]
+
+
+def floatratio(x):
+    # (num, den) of the shortest repr of float x, which needs no checks
+    s = repr(x)
+    if 'e' in s:
+        return parsedecimal(s)
+    whole, dot, frac = s.partition('.')
+    return int(whole + frac), POWERS[len(frac)]
+
+
+def ratio(*factors):
+    # the product of factors (prices, slides) as an exact (num, den). a
+    # float counts as its shortest repr, 0.1 is 1/10 and not the binary
+    # fraction next to it
+    num = den = 1
+    for x in factors:
+        if isinstance(x, float):
+            n, d = floatratio(x)
+        elif isinstance(x, tuple):
+            n, d = x
+        elif isinstance(x, int):
+            n, d = x, 1
+        else:
+            n, d = parsedecimal(str(x))
+        num *= n
+        den *= d
+    return num, den
+
+
+class Amount(object):
+    __slots__ = ('units', 'decimals')
+
+    def __init__(self, units=0, decimals=DEFAULT_DECIMALS):
+        self.units = units
+        self.decimals = decimals
+
+    @classmethod
+    def parse(cls, value, decimals=DEFAULT_DECIMALS, rounding='even'):
+        # value is a wallet string, a float, an int of whole coins, a
+        # Decimal or an Amount, rounded to decimals places
+        if isinstance(value, Amount):
+            return value.rescale(decimals, rounding)
+        if isinstance(value, str):
+            s = value
+            whole, dot, frac = s.partition('.')
+            # the wallet's own format, '12.345000', takes the fast way
+            if len(frac) == decimals and frac.isdigit() and whole.isdigit():
+                return cls(int(whole + frac), decimals)
+        elif isinstance(value, float):
+            num, den = floatratio(value)
+            return cls(divround(num * POWERS[decimals], den, rounding), decimals)
+        elif isinstance(value, int):
+            return cls(value * POWERS[decimals], decimals)
+        else:
+            s = str(value)
+        num, den = parsedecimal(s)
+        return cls(divround(num * POWERS[decimals], den, rounding), decimals)
+
+    @classmethod
+    def ofasset(cls, value, asset, rounding='even'):
+        return cls.parse(value, getdecimals(asset), rounding)
+
+    def rescale(self, decimals, rounding='even'):
+        if decimals == self.decimals:
+            return self
+        if decimals > self.decimals:
+            return Amount(self.units * POWERS[decimals - self.decimals], decimals)
+        return Amount(divround(self.units, POWERS[self.decimals - decimals], rounding), decimals)
+
+    def convert(self, price, decimals=None, rounding='even'):
+        # this amount times price, a number or a ratio() of several, as an
+        # amount of decimals places, eg. a maker amount at a taker per maker
+        # price to the taker amount
+        if decimals is None:
+            decimals = self.decimals
+        num, den = price if isinstance(price, tuple) else ratio(price)
+        shift = decimals - self.decimals
+        if shift >= 0:
+            num *= POWERS[shift]
+        else:
+            den *= POWERS[-shift]
+        return Amount(divround(self.units * num, den, rounding), decimals)
+
+    def price(self, other):
+        # other per this amount, as a float
+        return (other.units * POWERS[self.decimals]) / (self.units * POWERS[other.decimals])
+
+    def _align(self, other):
+        # units of self and other at the same decimals
+        if isinstance(other, Amount):
+            if self.decimals == other.decimals:
+                return self.units, other.units
+            if self.decimals > other.decimals:
+                return self.units, other.units * POWERS[self.decimals - other.decimals]
+            return self.units * POWERS[other.decimals - self.decimals], other.units
+        if isinstance(other, int):
+            return self.units, other * POWERS[self.decimals]
+        return None
+
+    def __str__(self):
+        if not self.decimals:
+            return str(self.units)
+        whole, frac = divmod(abs(self.units), POWERS[self.decimals])
+        return '{}{}.{:0{}d}'.format('-' if self.units < 0 else '', whole, frac, self.decimals)
+
+    def __repr__(self):
+        return 'Amount({!r})'.format(str(self))
+
+    def __float__(self):
+        return self.units / POWERS[self.decimals]
+
+    def __bool__(self):
+        return self.units != 0
+
+    def __hash__(self):
+        return hash(float(self))
+
+    def __eq__(self, other):
+        units = self._align(other)
+        return NotImplemented if units is None else units[0] == units[1]
+
+    def __ne__(self, other):
+        units = self._align(other)
+        return NotImplemented if units is None else units[0] != units[1]
+
+    def __lt__(self, other):
+        units = self._align(other)
+        return NotImplemented if units is None else units[0] < units[1]
+
+    def __le__(self, other):
+        units = self._align(other)
+        return NotImplemented if units is None else units[0] <= units[1]
+
+    def __gt__(self, other):
+        units = self._align(other)
+        return NotImplemented if units is None else units[0] > units[1]
+
+    def __ge__(self, other):
+        units = self._align(other)
+        return NotImplemented if units is None else units[0] >= units[1]
+
+    def __add__(self, other):
+        units = self._align(other)
+        if units is None:
+            return NotImplemented
+        return Amount(units[0] + units[1], max(self.decimals, other.decimals if isinstance(other, Amount) else 0))
+
+    __radd__ = __add__ # so sum() of amounts works
+
+    def __sub__(self, other):
+        units = self._align(other)
+        if units is None:
+            return NotImplemented
+        return Amount(units[0] - units[1], max(self.decimals, other.decimals if isinstance(other, Amount) else 0))
+
+    def __neg__(self):
+        return Amount(-self.units, self.decimals)
+
+    def __mul__(self, n):
+        # by a count, prices go through convert()
+        if not isinstance(n, int):
+            return NotImplemented
+        return Amount(self.units * n, self.decimals)
+
+    __rmul__ = __mul__
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# asyncio versions of the dxbottools helpers, all calls go through one
+# AsyncAuthServiceProxy so many of them can be in flight at once
+import asyncio
+from utils.asyncauthproxy import AsyncAuthServiceProxy
+from utils import dxbottools
+from utils import dxsettings
+
+rpc_connection = None
+
+
+def connect(host='127.0.0.1', port=None, rpcuser=None, rpcpassword=None):
+  # same as dxbottools.connect, for the async helpers
+  global rpc_connection
+  rpc_connection = AsyncAuthServiceProxy("http://%s:%s@%s:%s"%(rpcuser or dxsettings.rpcuser, rpcpassword or dxsettings.rpcpassword,
+                                                               host, port or dxsettings.rpcport),
+                                         pool_size=getattr(dxsettings, 'rpcpoolsize', 4), codec=dxbottools.rpccodec)
+  return rpc_connection
+
+
+connect()
+
+
+async def getsnapshot(maker, taker):
+  # balances, my orders and the maker/taker order book in one batched request
+  balances, myorders, fullbook = await rpc_connection.batch_([
+    ['dxGetTokenBalances'],
+    ['dxGetMyOrders'],
+    ['dxGetOrderBook', 3, maker, taker]])
+  dxbottools.refreshorders(myorders)
+  return dxbottools.Snapshot(dxbottools.parsebalances(balances), myorders, fullbook['asks'], fullbook['bids'])
+
+async def refreshorders(myorders=None):
+  # updates the shared dxbottools.orderstore, fetching dxGetMyOrders if not given
+  if myorders is None:
+    myorders = await rpc_connection.dxGetMyOrders()
+  return dxbottools.refreshorders(myorders)
+
+async def canceloldestorder(maker, taker, myorders=None):
+  oldest = (await refreshorders(myorders)).oldest(maker, taker)
+  if oldest is None:
+    return 0, 3539451969
+  oldestepoch, oldestorderid = oldest
+  await rpc_connection.dxCancelOrder(oldestorderid)
+  return oldestorderid, oldestepoch
+
+async def cancelorder(orderid):
+  results = await rpc_connection.dxCancelOrder(orderid)
+  if isinstance(results, dict) and 'error' in results:
+    raise RuntimeError(results)
+  return results
+
+async def cancelorders(orderids, rate=None, workers=None, retries=None):
+  # async dxbottools.cancelorders, same rate limit, retries and report
+  if rate is None:
+    rate = getattr(dxsettings, 'cancelrate', 4)
+  if workers is None:
+    workers = getattr(dxsettings, 'cancelworkers', getattr(dxsettings, 'rpcpoolsize', 4))
+  if retries is None:
+    retries = getattr(dxsettings, 'cancelretries', 2)
+  limiter = dxbottools.RateLimiter(rate, burst=workers)
+  inflight = asyncio.Semaphore(workers)
+
+  async def cancel(orderid):
+    attempt = 0
+    async with inflight:
+      while True:
+        attempt += 1
+        await asyncio.sleep(limiter.reserve())
+        try:
+          return {'status': 'canceled', 'attempts': attempt, 'result': await cancelorder(orderid)}
+        except Exception as err:
+          if attempt > retries:
+            return {'status': 'failed', 'attempts': attempt, 'error': str(err)}
+          await asyncio.sleep(attempt / float(rate))
+
+  orderids = list(orderids)
+  results = await asyncio.gather(*[cancel(orderid) for orderid in orderids])
+  return dict(zip(orderids, results))
+
+async def cancelallorders(rate=None):
+  # cancel all my open orders
+  report = await cancelorders(await getopenorder_ids(), rate)
+  dxbottools.printcancelreport(report)
+  return report
+
+async def cancelallordersbymarket(maker, taker, rate=None):
+  # cancel all my open orders in market
+  report = await cancelorders([zz['id'] for zz in await getopenordersbymarket(maker, taker)], rate)
+  dxbottools.printcancelreport(report)
+  return report
+
+async def getopenordersbymarket(maker, taker, myorders=None):
+    # returns open orders by market
+    return (await refreshorders(myorders)).openorders(maker, taker)
+
+async def getopenordersbymaker(maker):
+    # return orders open w/ maker
+    return (await refreshorders()).openorders(maker)
+
+async def getopenorders():
+    # return open orders
+    return (await refreshorders()).openorders()
+
+async def getopenorder_ids():
+    # return open order IDs
+    return [zz['id'] for zz in (await refreshorders()).openorders()]
+
+async def getorderbook(maker, taker):
+    fullbook = await rpc_connection.dxGetOrderBook(3, maker, taker)
+    asklist = fullbook['asks']
+    bidlist = fullbook['bids']
+    return (asklist, bidlist)
+
+async def makeorder(maker, makeramount, makeraddress, taker, takeramount, takeraddress):
+    results = await rpc_connection.dxMakeOrder(maker, makeramount, makeraddress, taker, takeramount, takeraddress, 'exact')
+    if 'id' in results:
+      return results
+    else:
+      raise RuntimeError(results)
+
+async def takeorder(id, fromaddr, toaddr):
+    results = await rpc_connection.dxTakeOrder(id, fromaddr, toaddr)
+    return results
@@ -39,17 +39,35 @@ try:
 except ImportError:
     import httplib
 import base64
+import codecs
 import decimal
 import json
 import logging
+import re
+import select
+import threading
+import time
 try:
     import urllib.parse as urlparse
 except ImportError:
     import urlparse
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from utils import metrics
+from utils.amount import Amount
 
 USER_AGENT = "AuthServiceProxy/0.1"
 
 HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 4
+NUMBER_MODES = ('decimal', 'float')
+STREAM_CHUNK = 65536
+# calls that change nothing in the wallet, safe to send again when the
+# connection drops before their response was read
+READONLY = ('dxGetTokenBalances', 'dxGetMyOrders', 'dxGetOrderBook', 'dxGetOrder',
+            'dxGetOrders', 'dxGetLocalTokens', 'dxGetNetworkTokens')
 
 log = logging.getLogger("BitcoinRPC")
 
@@ -75,19 +93,208 @@ class JSONRPCException(Exception):
 def EncodeDecimal(o):
     if isinstance(o, decimal.Decimal):
         return float(round(o, 8))
+    if isinstance(o, Amount):
+        # as the string XBridge takes, exact to the asset's decimals
+        return str(o)
     raise TypeError(repr(o) + " is not JSON serializable")
 
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+DELIMITERS = ' \t\n\r,:]}'
+
+class _ChunkReader(object):
+    """JSON text arriving in byte chunks, read one value at a time."""
+
+    def __init__(self, chunks, decoder):
+        self.chunks = iter(chunks)
+        self.decoder = decoder
+        self.utf8 = codecs.getincrementaldecoder('utf8')()
+        self.buf = ''
+        self.pos = 0
+
+    def fill(self):
+        # appends the next chunk, dropping text already consumed
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + self.utf8.decode(chunk)
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        # next non-whitespace character, '' at the end of the body
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def take(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('expected one of %r at %r' % (chars, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def value(self):
+        # a value is only complete once a delimiter after it has arrived,
+        # otherwise a number cut between two chunks would decode short
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            if (end < len(self.buf) and self.buf[end] in DELIMITERS) or not self.fill():
+                self.pos = end
+                return value
+
+class JSONCodec(object):
+    """Encodes JSON-RPC requests to bytes and decodes responses.
+
+    numbers picks how JSON numbers with a fraction or exponent decode:
+    'decimal' (exact decimal.Decimal, the default) or 'float' (fastest,
+    uses orjson when it is installed). Integer JSON numbers always decode
+    as int. Amounts go to utils.amount.Amount from either.
+    """
+
+    def __init__(self, numbers='decimal'):
+        if numbers not in NUMBER_MODES:
+            raise ValueError('numbers must be one of %s' % ', '.join(NUMBER_MODES))
+        self.numbers = numbers
+        if numbers == 'decimal':
+            self.decoder = json.JSONDecoder(parse_float=decimal.Decimal)
+        else:
+            self.decoder = json.JSONDecoder()
+        self.encoder = json.JSONEncoder(default=EncodeDecimal)
+
+    def encode(self, obj):
+        if orjson is not None:
+            return orjson.dumps(obj, default=EncodeDecimal)
+        return self.encoder.encode(obj).encode('utf8')
+
+    def decode(self, data):
+        if self.numbers == 'float' and orjson is not None:
+            return orjson.loads(data)
+        return self.decoder.decode(data.decode('utf8'))
+
+    def iterresult(self, chunks):
+        """Yields the items of the array result of a JSON-RPC response
+        whose body arrives as an iterable of byte chunks. Raises
+        JSONRPCException for an error response."""
+        reader = _ChunkReader(chunks, self.decoder)
+        streamed = False
+        result = None
+        reader.take('{')
+        if reader.peek() != '}':
+            while True:
+                key = reader.value()
+                reader.take(':')
+                if key == 'result' and reader.peek() == '[':
+                    reader.take('[')
+                    streamed = True
+                    if reader.peek() == ']':
+                        reader.take(']')
+                    else:
+                        while True:
+                            yield reader.value()
+                            if reader.take(',]') == ']':
+                                break
+                else:
+                    value = reader.value()
+                    if key == 'error' and value is not None:
+                        raise JSONRPCException(value)
+                    if key == 'result':
+                        result = value
+                if reader.take(',}') == '}':
+                    break
+        if not streamed:
+            if result is None:
+                raise JSONRPCException({
+                    'code': -343, 'message': 'missing JSON-RPC result'})
+            raise JSONRPCException({
+                'code': -344, 'message': 'JSON-RPC result is not an array'})
+
+DEFAULT_CODEC = JSONCodec()
+
+class ConnectionPool(object):
+    """Thread-safe pool of keep-alive HTTP connections to one RPC server.
+
+    At most pool_size connections are open at once; callers block in
+    acquire() until one is released.
+    """
+
+    def __init__(self, url, timeout=HTTP_TIMEOUT, pool_size=HTTP_POOL_SIZE):
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.__idle = []
+        self.__opened = 0
+        self.__cond = threading.Condition()
+
+    def _new_connection(self):
+        if self.url.port is None:
+            port = 80
+        else:
+            port = self.url.port
+        if self.url.scheme == 'https':
+            return httplib.HTTPSConnection(self.url.hostname, port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.url.hostname, port, timeout=self.timeout)
+
+    def acquire(self):
+        # returns (connection, reused)
+        with self.__cond:
+            while not self.__idle and self.__opened >= self.pool_size:
+                self.__cond.wait()
+            if self.__idle:
+                return self.__idle.pop(), True
+            self.__opened += 1
+        try:
+            return self._new_connection(), False
+        except:
+            with self.__cond:
+                self.__opened -= 1
+                self.__cond.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        with self.__cond:
+            if discard:
+                conn.close()
+                self.__opened -= 1
+            else:
+                self.__idle.append(conn)
+            self.__cond.notify()
+
+    def close(self):
+        with self.__cond:
+            while self.__idle:
+                self.__idle.pop().close()
+                self.__opened -= 1
+
+    @staticmethod
+    def alive(conn):
+        # an idle connection has nothing to read; if it is readable the
+        # server closed it (or sent something unasked), either way it is done
+        if conn.sock is None:
+            return False
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+        return not readable
+
+
 class AuthServiceProxy(object):
     __id_count = 0
+    __id_lock = threading.Lock()
 
-    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None):
+    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None,
+                 pool_size=HTTP_POOL_SIZE, codec=DEFAULT_CODEC):
         self.__service_url = service_url
         self.__service_name = service_name
         self.__url = urlparse.urlparse(service_url)
-        if self.__url.port is None:
-            port = 80
-        else:
-            port = self.__url.port
         (user, passwd) = (self.__url.username, self.__url.password)
         try:
             user = user.encode('utf8')
@@ -101,18 +308,13 @@ class AuthServiceProxy(object):
         self.__auth_header = b'Basic ' + base64.b64encode(authpair)
 
         self.__timeout = timeout
+        self.__codec = codec
 
         if connection:
-            # Callables re-use the connection of the original proxy
-            # self.__conn = connection TODO: resolve issue w/ connection w/ blocknet wallet
-            self.__conn = httplib.HTTPConnection(self.__url.hostname, port,
-                                                 timeout=timeout)
-        elif self.__url.scheme == 'https':
-            self.__conn = httplib.HTTPSConnection(self.__url.hostname, port,
-                                                  timeout=timeout)
+            # Callables re-use the connection pool of the original proxy
+            self.__pool = connection
         else:
-            self.__conn = httplib.HTTPConnection(self.__url.hostname, port,
-                                                 timeout=timeout)
+            self.__pool = ConnectionPool(self.__url, timeout, pool_size)
 
     def __getattr__(self, name):
         if name.startswith('__') and name.endswith('__'):
@@ -120,26 +322,83 @@ class AuthServiceProxy(object):
             raise AttributeError
         if self.__service_name is not None:
             name = "%s.%s" % (self.__service_name, name)
-        return AuthServiceProxy(self.__service_url, name, self.__timeout, self.__conn)
+        return AuthServiceProxy(self.__service_url, name, self.__timeout, self.__pool, codec=self.__codec)
+
+    @classmethod
+    def _next_id(cls):
+        with cls.__id_lock:
+            cls.__id_count += 1
+            return cls.__id_count
+
+    def _send(self, postdata, idempotent=False):
+        # POST postdata (bytes) on a pooled connection, returns the connection
+        # and its response with the body still unread. A kept-alive
+        # connection the wallet has since dropped fails on first use, in
+        # which case the request is sent once more on a fresh one. A failure
+        # reading the response may come after the wallet ran the request, so
+        # it is only retried when idempotent (the call changes nothing), and
+        # other calls check an idle connection is still up before using it.
+        headers = {'Host': self.__url.hostname,
+                   'User-Agent': USER_AGENT,
+                   'Authorization': self.__auth_header,
+                   'Content-type': 'application/json'}
+        retried = False
+        while True:
+            conn, reused = self.__pool.acquire()
+            if reused and not idempotent and not ConnectionPool.alive(conn):
+                self.__pool.release(conn, discard=True)
+                continue
+            sent = False
+            try:
+                # headers and body go out in separate send()s, http.client
+                # sets TCP_NODELAY so the body does not wait on a delayed ACK
+                conn.request('POST', self.__url.path, postdata, headers)
+                sent = True
+                conn.sock.settimeout(self.__timeout)
+                http_response = conn.getresponse()
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, ConnectionError) as e:
+                self.__pool.release(conn, discard=True)
+                if reused and not retried and (not sent or idempotent):
+                    log.debug("stale connection, reconnecting: %s" % e)
+                    retried = True
+                    continue
+                raise
+            except:
+                self.__pool.release(conn, discard=True)
+                raise
+            return conn, http_response
+
+    def _request(self, postdata, idempotent=False):
+        # POST postdata and return the decoded response
+        conn, http_response = self._send(postdata, idempotent)
+        try:
+            response = self._get_response(http_response)
+        except:
+            self.__pool.release(conn, discard=True)
+            raise
+        self.__pool.release(conn)
+        return response
 
     def __call__(self, *args):
-        AuthServiceProxy.__id_count += 1
-
-        log.debug("-%s-> %s %s"%(AuthServiceProxy.__id_count, self.__service_name,
-                                 json.dumps(args, default=EncodeDecimal)))
-        postdata = json.dumps({'version': '1.1',
-                               'method': self.__service_name,
-                               'params': args,
-                               'id': AuthServiceProxy.__id_count}, default=EncodeDecimal)
-        self.__conn.request('POST', self.__url.path, postdata,
-                            {'Host': self.__url.hostname,
-                             'User-Agent': USER_AGENT,
-                             'Authorization': self.__auth_header,
-                             'Content-type': 'application/json'})
-        self.__conn.sock.settimeout(self.__timeout)
-
-        response = self._get_response()
+        id_count = AuthServiceProxy._next_id()
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("-%s-> %s %s"%(id_count, self.__service_name,
+                                     json.dumps(args, default=EncodeDecimal)))
+        postdata = self.__codec.encode({'version': '1.1',
+                                        'method': self.__service_name,
+                                        'params': args,
+                                        'id': id_count})
+        start = time.perf_counter()
+        try:
+            response = self._request(postdata, self.__service_name in READONLY)
+        except:
+            metrics.rpc_errors.inc(self.__service_name, 'transport')
+            raise
+        finally:
+            metrics.rpc_seconds.observe(time.perf_counter() - start, self.__service_name)
         if response.get('error') is not None:
+            metrics.rpc_errors.inc(self.__service_name, str(response['error'].get('code')))
             raise JSONRPCException(response['error'])
         elif 'result' not in response:
             raise JSONRPCException({
@@ -147,43 +406,92 @@ class AuthServiceProxy(object):
         
         return response['result']
 
-    def batch_(self, rpc_calls):
+    def batch_(self, rpc_calls, raise_errors=True):
         """Batch RPC call.
            Pass array of arrays: [ [ "method", params... ], ... ]
            Returns array of results.
+           With raise_errors=False a failed call does not raise, its
+           JSONRPCException is returned in place of its result.
         """
         batch_data = []
         for rpc_call in rpc_calls:
-            AuthServiceProxy.__id_count += 1
-            m = rpc_call.pop(0)
-            batch_data.append({"jsonrpc":"2.0", "method":m, "params":rpc_call, "id":AuthServiceProxy.__id_count})
-
-        postdata = json.dumps(batch_data, default=EncodeDecimal)
-        log.debug("--> "+postdata)
-        self.__conn.request('POST', self.__url.path, postdata,
-                            {'Host': self.__url.hostname,
-                             'User-Agent': USER_AGENT,
-                             'Authorization': self.__auth_header,
-                             'Content-type': 'application/json'})
+            batch_data.append({"jsonrpc":"2.0", "method":rpc_call[0], "params":list(rpc_call[1:]), "id":AuthServiceProxy._next_id()})
+
+        postdata = self.__codec.encode(batch_data)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("--> "+postdata.decode('utf8'))
         results = []
-        responses = self._get_response()
+        start = time.perf_counter()
+        try:
+            responses = self._request(postdata, all(rpc_call[0] in READONLY for rpc_call in rpc_calls))
+        except:
+            metrics.rpc_errors.inc('batch', 'transport')
+            raise
+        finally:
+            metrics.rpc_seconds.observe(time.perf_counter() - start, 'batch')
         if isinstance(responses, (dict,)):
             if ('error' in responses) and (responses['error'] is not None):
                 raise JSONRPCException(responses['error'])
             raise JSONRPCException({
                 'code': -32700, 'message': 'Parse error'})
+        # servers may answer a batch in any order, match results up by id
+        byid = {}
         for response in responses:
-            if response['error'] is not None:
-                raise JSONRPCException(response['error'])
+            byid[response.get('id')] = response
+        for request in batch_data:
+            response = byid.get(request['id'])
+            if response is None:
+                error = JSONRPCException({
+                    'code': -343, 'message': 'missing JSON-RPC result'})
+            elif response.get('error') is not None:
+                error = JSONRPCException(response['error'])
             elif 'result' not in response:
-                raise JSONRPCException({
+                error = JSONRPCException({
                     'code': -343, 'message': 'missing JSON-RPC result'})
             else:
                 results.append(response['result'])
+                continue
+            metrics.rpc_errors.inc(request['method'], str(error.code))
+            if raise_errors:
+                raise error
+            results.append(error)
         return results
 
-    def _get_response(self):
-        http_response = self.__conn.getresponse()
+    def stream_(self, method, *params):
+        """Streaming RPC call for methods that return an array.
+           Yields the result items as the response body arrives, without
+           holding the whole body or the whole decoded array in memory.
+           The request is sent on the first next().
+        """
+        postdata = self.__codec.encode({'version': '1.1',
+                                        'method': method,
+                                        'params': params,
+                                        'id': AuthServiceProxy._next_id()})
+        start = time.perf_counter()
+        try:
+            conn, http_response = self._send(postdata, method in READONLY)
+        except:
+            metrics.rpc_errors.inc(method, 'transport')
+            metrics.rpc_seconds.observe(time.perf_counter() - start, method)
+            raise
+        done = False
+        try:
+            self._check_response(http_response)
+            for item in self.__codec.iterresult(iter(lambda: http_response.read(STREAM_CHUNK), b'')):
+                yield item
+            done = True
+        except JSONRPCException as e:
+            metrics.rpc_errors.inc(method, str(e.code))
+            raise
+        finally:
+            # a stream given up half way leaves body on the connection
+            self.__pool.release(conn, discard=not done)
+            metrics.rpc_seconds.observe(time.perf_counter() - start, method)
+
+    def close(self):
+        self.__pool.close()
+
+    def _check_response(self, http_response):
         if http_response is None:
             raise JSONRPCException({
                 'code': -342, 'message': 'missing HTTP response from server'})
@@ -193,10 +501,14 @@ class AuthServiceProxy(object):
             raise JSONRPCException({
                 'code': -342, 'message': 'non-JSON HTTP response with \'%i %s\' from server' % (http_response.status, http_response.reason)})
 
-        responsedata = http_response.read().decode('utf8')
-        response = json.loads(responsedata, parse_float=decimal.Decimal)
-        if "error" in response and response["error"] is None:
-            log.debug("<-%s- %s"%(response["id"], json.dumps(response["result"], default=EncodeDecimal)))
-        else:
-            log.debug("<-- "+responsedata)
+    def _get_response(self, http_response):
+        self._check_response(http_response)
+        # always drain the body so the connection can go back to the pool
+        responsedata = http_response.read()
+        response = self.__codec.decode(responsedata)
+        if log.isEnabledFor(logging.DEBUG):
+            if "error" in response and response["error"] is None:
+                log.debug("<-%s- %s"%(response["id"], json.dumps(response["result"], default=EncodeDecimal)))
+            else:
+                log.debug("<-- "+responsedata.decode('utf8'))
         return response
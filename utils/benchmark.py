@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# times benchmark cases and compares the results against a saved baseline
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+TOLERANCE = 0.15 # ops/s drop, as a fraction of the baseline, reported as a regression
+
+
+def percentile(values, fraction):
+    # values must be sorted
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(func, seconds=1.0, warmup=0.2):
+    # calls func repeatedly for warmup seconds untimed, then for seconds,
+    # timing each call. returns ops/s and per-call percentiles in microseconds
+    end = time.perf_counter() + warmup
+    while time.perf_counter() < end:
+        func()
+    timings = []
+    clock = time.perf_counter
+    started = clock()
+    end = started + seconds
+    now = started
+    while now < end:
+        func()
+        done = clock()
+        timings.append(done - now)
+        now = done
+    total = now - started
+    timings.sort()
+    return {
+        'n': len(timings),
+        'ops': len(timings) / total,
+        'p50': percentile(timings, 0.50) * 1e6,
+        'p95': percentile(timings, 0.95) * 1e6,
+        'p99': percentile(timings, 0.99) * 1e6,
+    }
+
+
+def importtime(module, runs=3):
+    # (seconds, loaded modules) of the fastest of runs fresh interpreters
+    # importing module, from python -X importtime
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for run in range(runs):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                cwd=root, stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+        seconds = None
+        loaded = set()
+        for line in output.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            fields = line.split('|')
+            name = fields[2].strip()
+            if not fields[1].strip().isdigit():
+                continue
+            loaded.add(name)
+            if name == module:
+                seconds = int(fields[1]) / 1e6
+        if best is None or seconds < best[0]:
+            best = (seconds, loaded)
+    return best
+
+
+def formatresult(name, result):
+    return '{:<28} {:>12.1f} ops/s   p50 {:>10.1f}us   p95 {:>10.1f}us   p99 {:>10.1f}us'.format(
+        name, result['ops'], result['p50'], result['p95'], result['p99'])
+
+
+def save(path, results):
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'cases': results}, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['cases']
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    # returns (lines, regressions): one report line per case found in both,
+    # and the names of cases whose ops/s dropped by more than tolerance
+    lines = []
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append('{:<28} (not in baseline)'.format(name))
+            continue
+        change = result['ops'] / base['ops'] - 1 if base['ops'] else 0.0
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        lines.append('{:<28} {:>+8.1%} ops/s   p99 {:>10.1f}us -> {:>10.1f}us{}'.format(
+            name, change, base['p99'], result['p99'], flag))
+    return lines, regressions
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# logging that stays off the trading thread. setup() routes every log record
+# through a queue to a listener thread, which writes it as one JSON line to
+# a size rotated log file and as plain text to the console. the loops log
+# one compact record per pass, with the details as extra data:
+#   log.info('pass ...', extra={'data': {'markets': {...}, 'seconds': 0.01}})
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGFILE = 'botdebug.log'
+MAXBYTES = 10 * 1024 * 1024 # log file size that starts a new file
+BACKUPS = 5 # rotated log files kept
+
+# quiet: warnings and errors, loop: one record per loop pass, debug: every
+# step of every pass
+VERBOSITY = {'quiet': logging.WARNING, 'loop': logging.INFO, 'debug': logging.DEBUG}
+
+
+class JSONFormatter(logging.Formatter):
+    # {"time": ..., "level": ..., "logger": ..., "msg": ..., <data>} per line
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        data = getattr(record, 'data', None)
+        if data:
+            entry.update(data)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class ConsoleFormatter(logging.Formatter):
+    # the message alone, errors marked as the bot has always printed them
+
+    def format(self, record):
+        text = logging.Formatter.format(self, record)
+        return 'ERROR: ' + text if record.levelno >= logging.ERROR else text
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    # the stdlib handler, except the traceback is kept apart in exc_text for
+    # the JSON 'exc' field instead of being appended to the message
+
+    def prepare(self, record):
+        if not (record.exc_info or record.exc_text):
+            return logging.handlers.QueueHandler.prepare(self, record)
+        exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.exc_info = None
+        record.exc_text = None
+        record = logging.handlers.QueueHandler.prepare(self, record)
+        record.exc_text = exc_text
+        return record
+
+
+def setup(path=LOGFILE, verbosity='loop', maxbytes=MAXBYTES, backups=BACKUPS, console=True):
+    # configures the root logger, returns the started QueueListener. it is
+    # stopped, and the queue drained, at exit
+    if verbosity not in VERBOSITY:
+        raise ValueError('unknown verbosity: {} (quiet, loop or debug)'.format(verbosity))
+    handlers = []
+    if path:
+        filehandler = logging.handlers.RotatingFileHandler(path, maxBytes=int(maxbytes), backupCount=int(backups), delay=True)
+        filehandler.setFormatter(JSONFormatter())
+        handlers.append(filehandler)
+    if console:
+        consolehandler = logging.StreamHandler(sys.stdout)
+        consolehandler.setFormatter(ConsoleFormatter('%(message)s'))
+        handlers.append(consolehandler)
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(VERBOSITY[verbosity])
+    # request and response bodies, far too big to log every pass
+    logging.getLogger('BitcoinRPC').setLevel(max(logging.INFO, VERBOSITY[verbosity]))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CG_INDEX_REFRESH = 86400 # seconds between coin list downloads
+
+
+class CoinGeckoIndex(object):
+    # symbol -> CoinGecko id lookup built from get_coins_list(). the list is
+    # kept in an on-disk cache so a restart does not download it again, and
+    # is refreshed in the background once it is older than refresh seconds.
+    # symbols shared by several coins must be pinned in overrides
+
+    def __init__(self, api, cachefile=None, refresh=CG_INDEX_REFRESH, overrides=None):
+        self.api = api
+        self.cachefile = cachefile
+        self.refresh = refresh
+        self.overrides = dict((k.upper(), v) for k, v in (overrides or {}).items())
+        self.updated = 0
+        self.__ids = None
+        self.__refreshing = False
+        self.__lock = threading.Lock()
+        self.load()
+
+    def _build(self, coins):
+        ids = {}
+        for coin in coins:
+            ids.setdefault(coin['symbol'].lower(), []).append(coin['id'])
+        self.__ids = ids
+
+    def load(self):
+        # loads the cached coin list, returns False if there is none
+        if not self.cachefile or not os.path.exists(self.cachefile):
+            return False
+        try:
+            with open(self.cachefile) as f:
+                cached = json.load(f)
+            self._build(cached['coins'])
+            self.updated = cached['updated']
+        except (ValueError, KeyError, OSError) as e:
+            log.error('Ignoring unreadable CoinGecko index {}: {}'.format(self.cachefile, e))
+            return False
+        return True
+
+    def update(self):
+        # downloads the coin list and rewrites the on-disk cache
+        coins = self.api.get_coins_list()
+        updated = time.time()
+        self._build(coins)
+        self.updated = updated
+        if self.cachefile:
+            tmpfile = '{}.tmp'.format(self.cachefile)
+            with open(tmpfile, 'w') as f:
+                json.dump({'updated': updated, 'coins': coins}, f)
+            os.replace(tmpfile, self.cachefile)
+
+    def _background_update(self):
+        try:
+            self.update()
+        except Exception as e:
+            log.error('CoinGecko index refresh failed: {}'.format(e))
+        finally:
+            with self.__lock:
+                self.__refreshing = False
+
+    def lookup(self, symbol):
+        # returns the CoinGecko id for symbol, or None if it is not listed.
+        # raises LookupError if several coins use symbol and none is pinned
+        symbol = symbol.upper()
+        if symbol in self.overrides:
+            return self.overrides[symbol]
+        if self.__ids is None:
+            self.update()
+        elif time.time() - self.updated > self.refresh:
+            with self.__lock:
+                start = not self.__refreshing
+                self.__refreshing = True
+            if start:
+                threading.Thread(target=self._background_update, daemon=True).start()
+        ids = self.__ids.get(symbol.lower())
+        if not ids:
+            return None
+        if len(ids) > 1:
+            raise LookupError('{} matches several CoinGecko ids ({}), set cgidoverride[\'{}\'] in dxsettings.py'.format(
+                symbol, ', '.join(ids), symbol))
+        return ids[0]
@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
-import requests
+import logging
 from utils import dxsettings
 
+log = logging.getLogger(__name__)
+
+TIMEOUT = 5 # seconds a price request may take, dxsettings.pricedeadline if set
+
 
 # default request function
 def baserequest(url):
+    import requests
     try:
-      return requests.get(url).json()
+      return requests.get(url, timeout=getattr(dxsettings, 'pricedeadline', TIMEOUT)).json()
     except Exception as e:
-      print('ERROR: Unable to retrieve price, check custom price URL:\n\t{}'.format(url))
+      log.error('Unable to retrieve price, check custom price URL:\n\t{}'.format(url))
       raise RuntimeError(e)
 
 
@@ -1,22 +1,153 @@
 #!/usr/bin/python3
-from utils.authproxy import AuthServiceProxy, JSONRPCException
-import flask.json
-import decimal
+from utils.authproxy import AuthServiceProxy, JSONRPCException, JSONCodec
 import time
+import collections
+import heapq
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import calendar
-import dateutil
-from dateutil import parser
 from utils import dxsettings
+from utils.amount import Amount
 
-rpc_connection = AuthServiceProxy("http://%s:%s@127.0.0.1:%s"%(dxsettings.rpcuser, dxsettings.rpcpassword, dxsettings.rpcport))
+rpccodec = JSONCodec(getattr(dxsettings, 'rpcnumbers', 'decimal'))
+rpc_connection = None
 
-class MyJSONEncoder(flask.json.JSONEncoder):
 
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            # convert decimal instances to strings
-            return str(obj)
-        return super(MyJSONEncoder, self).default(obj)
+def connect(host='127.0.0.1', port=None, rpcuser=None, rpcpassword=None):
+  # points every wallet call of this process at the XBridge RPC on
+  # host:port, dxsettings.rpcport/rpcuser/rpcpassword where not given.
+  # meant for startup, orderstore is kept as it is
+  global rpc_connection
+  rpc_connection = AuthServiceProxy("http://%s:%s@%s:%s"%(rpcuser or dxsettings.rpcuser, rpcpassword or dxsettings.rpcpassword,
+                                                          host, port or dxsettings.rpcport),
+                                    pool_size=getattr(dxsettings, 'rpcpoolsize', 4), codec=rpccodec)
+  return rpc_connection
+
+
+connect()
+
+# wallet state for one market as returned by getsnapshot()
+Snapshot = collections.namedtuple('Snapshot', ['balances', 'myorders', 'asks', 'bids'])
+
+
+class OrderStore(object):
+  # local copy of dxGetMyOrders indexed by id, by (maker, taker) market and
+  # by status, with a per-market min-heap of open orders on created_at.
+  # update() only re-indexes orders that are new or changed status.
+
+  def __init__(self):
+    self.byid = {}
+    self.bystatus = {}
+    self.bymarket = {}
+    self.__heaps = {}
+    self.__epochs = {}
+    self.__lastorders = None
+
+  def update(self, myorders):
+    if myorders is self.__lastorders:
+      # same dxGetMyOrders result (eg. one snapshot shared by many markets)
+      return self
+    self.__lastorders = myorders
+    seen = set()
+    for z in myorders:
+      oid = z['id']
+      seen.add(oid)
+      old = self.byid.get(oid)
+      if old is not None and old['status'] == z['status']:
+        self.byid[oid] = z
+        self.bystatus[z['status']][oid] = z
+        if z['status'] == "open":
+          self.bymarket[(z['maker'], z['taker'])][oid] = z
+        continue
+      if old is not None:
+        self._unindex(old)
+      self._index(z)
+    # orders the wallet no longer reports
+    for oid in [oid for oid in self.byid if oid not in seen]:
+      self._unindex(self.byid[oid])
+      self.__epochs.pop(oid, None)
+    return self
+
+  def _index(self, z):
+    oid = z['id']
+    self.byid[oid] = z
+    self.bystatus.setdefault(z['status'], {})[oid] = z
+    if z['status'] == "open":
+      market = (z['maker'], z['taker'])
+      self.bymarket.setdefault(market, {})[oid] = z
+      heap = self.__heaps.setdefault(market, [])
+      heapq.heappush(heap, (self.epoch(z), oid))
+      if len(heap) > 2 * len(self.bymarket[market]) + 16:
+        # too many lazily deleted entries, rebuild from the open orders
+        heap[:] = [(self.__epochs[zid], zid) for zid in self.bymarket[market]]
+        heapq.heapify(heap)
+
+  def _unindex(self, z):
+    # heap entries are dropped lazily in oldest()
+    oid = z['id']
+    del self.byid[oid]
+    del self.bystatus[z['status']][oid]
+    if z['status'] == "open":
+      del self.bymarket[(z['maker'], z['taker'])][oid]
+
+  def epoch(self, z):
+    # created_at of order z as epoch, parsed once per order id for as long
+    # as the wallet reports the order
+    oid = z['id']
+    if oid not in self.__epochs:
+      self.__epochs[oid] = getepochtime(z['created_at'])
+    return self.__epochs[oid]
+
+  def ismine(self, orderid):
+    return orderid in self.byid
+
+  def openorders(self, maker=None, taker=None):
+    if maker is None:
+      return list(self.bystatus.get("open", {}).values())
+    if taker is None:
+      return [zz for (m, t), orders in self.bymarket.items() if m == maker for zz in orders.values()]
+    return list(self.bymarket.get((maker, taker), {}).values())
+
+  def oldest(self, maker, taker):
+    # returns (epoch, order id) of the oldest open order in market, or None
+    heap = self.__heaps.get((maker, taker))
+    openinmarket = self.bymarket.get((maker, taker), {})
+    while heap:
+      epoch, oid = heap[0]
+      if oid in openinmarket and self.__epochs.get(oid) == epoch:
+        return epoch, oid
+      heapq.heappop(heap)
+    return None
+
+
+orderstore = OrderStore()
+
+
+def refreshorders(myorders=None):
+  # updates orderstore from myorders, fetching dxGetMyOrders if not given
+  if myorders is None:
+    myorders = rpc_connection.dxGetMyOrders()
+  return orderstore.update(myorders)
+
+
+def parsebalances(balances):
+  # dxGetTokenBalances as {asset: Amount}, at each asset's decimals
+  return dict((asset, Amount.ofasset(value, asset)) for asset, value in balances.items())
+
+
+def getsnapshot(maker=None, taker=None):
+  # balances, my orders and the maker/taker order book in one batched
+  # request. without a market only balances and my orders are fetched
+  calls = [['dxGetTokenBalances'], ['dxGetMyOrders']]
+  if maker is not None:
+    calls.append(['dxGetOrderBook', 3, maker, taker])
+  results = rpc_connection.batch_(calls)
+  refreshorders(results[1])
+  balances = parsebalances(results[0])
+  if maker is None:
+    return Snapshot(balances, results[1], None, None)
+  return Snapshot(balances, results[1], results[2]['asks'], results[2]['bids'])
 
 
 def lookup_order_id(orderid, myorders):
@@ -24,66 +155,134 @@ def lookup_order_id(orderid, myorders):
   return [zz for zz in myorders if zz['id'] == orderid]
 
 
-def canceloldestorder(maker, taker):
-  myorders = getopenordersbymarket(maker, taker)
-  oldestepoch = 3539451969
-  currentepoch = 0
-  epochlist = 0
-  oldestorderid = 0
-  for z in myorders:
-    if z['status'] == "open":
-      createdat = z['created_at']
-      currentepoch = getepochtime((z['created_at']))
-      if oldestepoch > currentepoch:
-        oldestorderid = z['id']
-        oldestepoch = currentepoch
-      if oldestorderid != 0:
-        rpc_connection.dxCancelOrder(oldestorderid)  
+def canceloldestorder(maker, taker, myorders=None):
+  # myorders: optional dxGetMyOrders result (eg. from getsnapshot) to use
+  # instead of fetching it again
+  oldest = refreshorders(myorders).oldest(maker, taker)
+  if oldest is None:
+    return 0, 3539451969
+  oldestepoch, oldestorderid = oldest
+  rpc_connection.dxCancelOrder(oldestorderid)
   return oldestorderid, oldestepoch
 
-def cancelallorders():
-  # cancel all my open orders
-  myorders = rpc_connection.dxGetMyOrders()
-  for z in myorders:
-    if z['status'] == "open":
-      results = rpc_connection.dxCancelOrder(z['id'])
-      time.sleep(3.5)
-      print (results)
-  return
+class RateLimiter(object):
+  # allows rate calls per second on average, up to burst of them back to back
+
+  def __init__(self, rate, burst=1):
+    if rate <= 0:
+      raise ValueError('rate must be positive')
+    self.rate = float(rate)
+    self.burst = burst
+    self.__next = 0.0
+    self.__lock = threading.Lock()
+
+  def reserve(self):
+    # claims the next slot and returns how many seconds to wait for it
+    with self.__lock:
+      now = time.monotonic()
+      self.__next = max(self.__next, now - (self.burst - 1) / self.rate)
+      delay = self.__next - now
+      self.__next += 1.0 / self.rate
+    return max(delay, 0.0)
+
+  def wait(self):
+    time.sleep(self.reserve())
+
+
+def cancelorder(orderid):
+  results = rpc_connection.dxCancelOrder(orderid)
+  if isinstance(results, dict) and 'error' in results:
+    raise RuntimeError(results)
+  return results
+
+def getorderstatus(orderid):
+  # the wallet's status of orderid, None if it cannot be had
+  try:
+    return rpc_connection.dxGetOrder(orderid)['status']
+  except Exception:
+    return None
+
+def cancelorders(orderids, rate=None, workers=None, retries=None):
+  # cancels orderids concurrently, at most rate cancels per second, retrying
+  # each failed cancel up to retries more times. a retry that fails may be
+  # failing because an earlier attempt canceled the order and only its
+  # answer was lost, so the order's status is checked then. returns a report
+  # of {orderid: {'status': 'canceled'|'failed', 'attempts': n, 'result'|'error': ...}}
+  if rate is None:
+    rate = getattr(dxsettings, 'cancelrate', 4)
+  if workers is None:
+    workers = getattr(dxsettings, 'cancelworkers', getattr(dxsettings, 'rpcpoolsize', 4))
+  if retries is None:
+    retries = getattr(dxsettings, 'cancelretries', 2)
+  limiter = RateLimiter(rate, burst=workers)
+
+  def cancel(orderid):
+    attempt = 0
+    while True:
+      attempt += 1
+      limiter.wait()
+      try:
+        return {'status': 'canceled', 'attempts': attempt, 'result': cancelorder(orderid)}
+      except Exception as err:
+        if attempt > 1 and getorderstatus(orderid) == 'canceled':
+          return {'status': 'canceled', 'attempts': attempt, 'result': 'canceled by an earlier attempt'}
+        if attempt > retries:
+          return {'status': 'failed', 'attempts': attempt, 'error': str(err)}
+        time.sleep(attempt / float(rate))
 
-def cancelallordersbymarket(maker, taker):
+  orderids = list(orderids)
+  if not orderids:
+    return {}
+  with ThreadPoolExecutor(max_workers=min(workers, len(orderids))) as executor:
+    return dict(zip(orderids, executor.map(cancel, orderids)))
+
+def printcancelreport(report):
+  for orderid, result in report.items():
+    print (orderid, result['status'], result.get('result', result.get('error')))
+  failed = len([zz for zz in report.values() if zz['status'] != 'canceled'])
+  print ('>>>> Canceled {} of {} orders, {} failed'.format(len(report) - failed, len(report), failed))
+
+def cancelallorders(rate=None):
   # cancel all my open orders
-  myorders = getopenordersbymarket(maker, taker)
-  for z in myorders:
-    if z['status'] == "open":
-      results = rpc_connection.dxCancelOrder(z['id'])
-      time.sleep(3.5)
-      print (results)
-  return
+  report = cancelorders(getopenorder_ids(), rate)
+  printcancelreport(report)
+  return report
 
-def getopenordersbymarket(maker, taker):
+def cancelallordersbymarket(maker, taker, rate=None):
+  # cancel all my open orders in market
+  report = cancelorders([zz['id'] for zz in getopenordersbymarket(maker, taker)], rate)
+  printcancelreport(report)
+  return report
+
+def getopenordersbymarket(maker, taker, myorders=None):
     # returns open orders by market
-    myorders = rpc_connection.dxGetMyOrders()
-    return [zz for zz in myorders if (zz['status'] == "open") and (zz['maker'] == maker) and (zz['taker'] == taker)]
+    return refreshorders(myorders).openorders(maker, taker)
 
 def getopenordersbymaker(maker):
     # return orders open w/ maker 
-    myorders = rpc_connection.dxGetMyOrders()
-    return [zz for zz in myorders if (zz['status'] == "open") and (zz['maker'] == maker)]
+    return refreshorders().openorders(maker)
 
 def getopenorders():
     # return open orders
-    myorders = rpc_connection.dxGetMyOrders()
-    return [zz for zz in myorders if zz['status'] == "open"] 
+    return refreshorders().openorders()
 
 def getopenorder_ids():
     # return open order IDs
-    myorders = rpc_connection.dxGetMyOrders()
-    return [zz['id'] for zz in myorders if zz['status'] == "open"]
+    return [zz['id'] for zz in refreshorders().openorders()]
 
 def getepochtime(created):
-    # converts created to epoch
-    return calendar.timegm(dateutil.parser.parse(created).timetuple())
+    # converts created to epoch. the wallet's fixed ISO-8601 format
+    # (2018-09-17T17:33:44.876Z) is sliced directly, anything else goes
+    # through dateutil
+    if (len(created) >= 19 and created[4] == '-' and created[7] == '-' and created[10] in 'T '
+        and created[13] == ':' and created[16] == ':' and (len(created) == 19 or created[19] in '.Z')):
+      try:
+        return calendar.timegm((int(created[0:4]), int(created[5:7]), int(created[8:10]),
+                                int(created[11:13]), int(created[14:16]), int(created[17:19])))
+      except ValueError:
+        pass
+    from dateutil import parser as dateparser
+    return calendar.timegm(dateparser.parse(created).timetuple())
    
 def getorderbook(maker, taker):
     fullbook = rpc_connection.dxGetOrderBook(3, maker, taker)
@@ -97,6 +296,146 @@ def getlowprice(orderlist):
 def gethighprice(orderlist):
     return max(orderlist, key=lambda x: x[0])
 
+
+class BookSide(object):
+  # one side of an order book, [price, size, id] entries kept sorted best
+  # price first (lowest ask, highest bid). depth and vwap use prefix sums
+  # of size and price * size that are only built as deep as asked for, and
+  # only rebuilt from the first entry an update touched
+
+  def __init__(self, sign):
+    self.sign = sign # 1 for asks, -1 for bids
+    self.keys = [] # (sign * price, id), sorted
+    self.entries = [] # same order as keys
+    self.byid = {}
+    self.__sizes = [] # cumulative size up to each entry
+    self.__costs = [] # cumulative price * size up to each entry
+
+  def __len__(self):
+    return len(self.entries)
+
+  def _key(self, z):
+    return (self.sign * float(z[0]), z[2])
+
+  def update(self, entries):
+    # applies a fresh dxGetOrderBook side, by order id. returns the number
+    # of orders added, removed or changed
+    latest = {z[2]: z for z in entries}
+    removed = self.byid.keys() - latest.keys()
+    get = self.byid.get
+    changed = [z for oid, z in latest.items() if get(oid) != z]
+    if not removed and not changed:
+      return 0
+    if len(removed) + len(changed) > len(self.entries) // 4:
+      # mostly new book, sorting once beats many list inserts
+      pairs = sorted((self._key(z), z) for z in latest.values())
+      self.keys = [key for key, z in pairs]
+      self.entries = [z for key, z in pairs]
+      self.byid = latest
+      first = 0
+    else:
+      first = len(self.entries)
+      for oid in removed:
+        first = min(first, self._remove(self.byid.pop(oid)))
+      for z in changed:
+        old = self.byid.get(z[2])
+        if old is not None:
+          first = min(first, self._remove(old))
+        self.byid[z[2]] = z
+        key = self._key(z)
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.entries.insert(i, z)
+        first = min(first, i)
+    del self.__sizes[first:]
+    del self.__costs[first:]
+    return len(removed) + len(changed)
+
+  def _remove(self, z):
+    i = bisect.bisect_left(self.keys, self._key(z))
+    del self.keys[i]
+    del self.entries[i]
+    return i
+
+  def best(self):
+    return self.entries[0] if self.entries else None
+
+  def _sums(self, amount):
+    # extends the prefix sums until they cover amount or the whole side
+    sizes, costs = self.__sizes, self.__costs
+    size = sizes[-1] if sizes else 0.0
+    cost = costs[-1] if costs else 0.0
+    entries = self.entries
+    while size < amount and len(sizes) < len(entries):
+      z = entries[len(sizes)]
+      size += float(z[1])
+      cost += float(z[0]) * float(z[1])
+      sizes.append(size)
+      costs.append(cost)
+    return sizes, costs
+
+  def depth(self, amount):
+    # worst price taken when filling amount from the best price on, or
+    # None when the side holds less than amount
+    amount = float(amount)
+    sizes, costs = self._sums(amount)
+    i = bisect.bisect_left(sizes, amount)
+    if i == len(sizes):
+      return None
+    return self.entries[i][0]
+
+  def vwap(self, amount):
+    # average price of filling amount from the best price on, or None
+    amount = float(amount)
+    sizes, costs = self._sums(amount)
+    i = bisect.bisect_left(sizes, amount)
+    if i == len(sizes) or amount <= 0:
+      return None
+    before = sizes[i - 1] if i else 0.0
+    cost = (costs[i - 1] if i else 0.0) + (amount - before) * float(self.entries[i][0])
+    return cost / amount
+
+
+class OrderBook(object):
+  # dxGetOrderBook detail 3 of one market kept sorted between polls. prices
+  # are in taker per maker, sizes in maker. best prices and spread are O(1),
+  # depth and vwap O(log n) once the prefix sums reach the amount asked for
+
+  def __init__(self, maker, taker):
+    self.maker = maker
+    self.taker = taker
+    self.asks = BookSide(1)
+    self.bids = BookSide(-1)
+
+  def update(self, asks, bids):
+    # returns the number of orders that changed since the last update
+    return self.asks.update(asks) + self.bids.update(bids)
+
+  def refresh(self):
+    asks, bids = getorderbook(self.maker, self.taker)
+    return self.update(asks, bids)
+
+  def bestask(self):
+    return self.asks.best()
+
+  def bestbid(self):
+    return self.bids.best()
+
+  def spread(self):
+    # lowest ask minus highest bid, None if a side is empty
+    ask = self.asks.best()
+    bid = self.bids.best()
+    if ask is None or bid is None:
+      return None
+    return float(ask[0]) - float(bid[0])
+
+  def depth(self, side, amount):
+    # side is 'asks' (buying maker) or 'bids' (selling maker)
+    return getattr(self, side).depth(amount)
+
+  def vwap(self, side, amount):
+    return getattr(self, side).vwap(amount)
+
 def makeorder(maker, makeramount, makeraddress, taker, takeramount, takeraddress):
     #
     results = rpc_connection.dxMakeOrder(maker, makeramount, makeraddress, taker, takeramount, takeraddress, 'exact')
@@ -105,16 +444,59 @@ def makeorder(maker, makeramount, makeraddress, taker, takeramount, takeraddress
     else:
       raise RuntimeError(results)
 
+def makeorders(orders):
+    # places many orders in one batched request. orders is a list of
+    # (maker, makeramount, makeraddress, taker, takeramount, takeraddress);
+    # returns a result dict or an exception for each order, in order
+    calls = [['dxMakeOrder'] + list(order) + ['exact'] for order in orders]
+    results = []
+    for result in rpc_connection.batch_(calls, raise_errors=False):
+      if isinstance(result, Exception) or 'id' in result:
+        results.append(result)
+      else:
+        results.append(RuntimeError(result))
+    return results
+
 def takeorder(id, fromaddr, toaddr):
     results = rpc_connection.dxTakeOrder(id, fromaddr, toaddr)
     return results
 
+def takeorders(takes, dryrun=False):
+    # takes many orders in one batched request. takes is a list of
+    # (id, fromaddr, toaddr); returns a result dict or an exception for each
+    # take, in order. dryrun only checks the takes with the wallet
+    extra = ['dryrun'] if dryrun else []
+    calls = [['dxTakeOrder'] + list(take) + extra for take in takes]
+    if not calls:
+      return []
+    return rpc_connection.batch_(calls, raise_errors=False)
+
+def getbooks(markets, orderids=()):
+    # balances, the detail 3 order book of every (maker, taker) market and
+    # the state of orderids, in one batched request. returns (balances,
+    # {market: (asks, bids)}, {orderid: order or exception})
+    markets = list(markets)
+    orderids = list(orderids)
+    calls = [['dxGetTokenBalances']]
+    calls += [['dxGetOrderBook', 3, maker, taker] for maker, taker in markets]
+    calls += [['dxGetOrder', orderid] for orderid in orderids]
+    results = rpc_connection.batch_(calls, raise_errors=False)
+    if isinstance(results[0], Exception):
+      raise results[0]
+    books = {}
+    for market, book in zip(markets, results[1:1 + len(markets)]):
+      if isinstance(book, Exception):
+        raise book
+      books[market] = (book['asks'], book['bids'])
+    return parsebalances(results[0]), books, dict(zip(orderids, results[1 + len(markets):]))
+
 def showorders():
     print ('### Getting balances >>>')
     mybalances = rpc_connection.dxGetTokenBalances()
     print (mybalances)
     print ('### Getting my orders >>>')
     myorders = rpc_connection.dxGetMyOrders()
+    store = refreshorders(myorders)
     for z in myorders:
       print (z['status'], z['id'], z['maker'], z['maker_size'], z['taker'],z['taker_size'], float(z['taker_size'])/float(z['maker_size']))
 
@@ -122,7 +504,7 @@ def showorders():
     print ('#############################################################')
     for z in allorders:
       # checks if your order
-      if lookup_order_id(z['id'], myorders):
+      if store.ismine(z['id']):
         ismyorder = "True"
       else:
         ismyorder = "False"
@@ -5,11 +5,40 @@ tradingaddress['SYS'] = '_address_'
 tradingaddress['LTC'] = '_address_'
 tradingaddress['BLOCK'] = '_address_' 
 tradingaddress['MUE'] = '_address_'
+# decimal places order amounts are rounded to, 6 if not listed
+assetdecimals = {}
+assetdecimals['BTC'] = 8
 rpcport = 41414
 rpcuser = '_rpcuser_'
 rpcpassword = '_rpcpassword_'
+rpcpoolsize = 4 # max keep-alive connections to the wallet
+rpcnumbers = 'decimal' # wallet JSON numbers decode as: decimal (exact) or float (fastest)
+cancelrate = 4 # max order cancels per second for --cancelall/--cancelmarket
+cancelworkers = 4 # cancels in flight at once for --cancelall/--cancelmarket (default rpcpoolsize)
+cancelretries = 2 # extra attempts for a failed cancel
 cryptobridgeURL = 'https://api.crypto-bridge.org/api/v1/ticker' # required if using the --usecb flag
 
+# CoinGecko settings: used with the --usecg flag.
+cgindexfile = 'cgcoins.json' # on-disk cache of the CoinGecko coin list
+cgindexrefresh = 86400 # seconds between coin list downloads
+# CoinGecko id to use for an asset; required when several coins share its symbol
+cgidoverride = {}
+cgidoverride['BTC'] = 'bitcoin'
+cgidoverride['LTC'] = 'litecoin'
+cgidoverride['SYS'] = 'syscoin'
+cgidoverride['BLOCK'] = 'blocknet'
+
+
+# Aggregate price settings: used with the --useagg flag.
+pricesources = ['cg', 'custom', 'cb', 'bt'] # sources queried concurrently
+pricedeadline = 5 # seconds to wait for quotes
+pricerule = 'median' # median, weighted or first (first good quote to arrive)
+priceweights = {'cg': 1, 'custom': 1, 'cb': 1, 'bt': 1} # used by the weighted rule
+pricemaxdeviation = 0.05 # drop quotes more than 5% away from the median
+
+# Price feed settings: used with the --usefeed flag and by pricefeed.py.
+feedsocket = 'pricefeed.sock' # Unix socket the price feed daemon serves on
+feedsource = 'cg' # source the feed is asked for when no other pricing flag is given
 
 # Custom price settings: Required if using the --usecustom flag.
 apiendpoint = {}
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# in-memory stand-in for the Blocknet wallet's XBridge JSON-RPC interface,
+# for driving dxmakerbot.py, dxtaker.py and AuthServiceProxy offline.
+# implements dxGetTokenBalances, dxGetMyOrders, dxGetOrders, dxGetOrder,
+# dxGetOrderBook, dxMakeOrder, dxTakeOrder and dxCancelOrder plus JSON-RPC
+# batches, with optional latency, injected errors/dropped connections and
+# random fills
+import base64
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# XBridge error codes
+INVALID_PARAMETERS = 1024
+INSUFFICIENT_FUNDS = 1025
+NOT_FOUND = 1030
+INJECTED_ERROR = -32603
+
+
+class XBridgeError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+
+
+def amount(value):
+    # XBridge reports amounts as strings with 6 decimals
+    return '%.6f' % value
+
+
+def now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class FakeXBridge(object):
+    # wallet state: balances, my orders and other makers' orders
+
+    def __init__(self, balances=None, fillrate=0.0):
+        self.balances = dict((asset, Decimal(str(value))) for asset, value in (balances or {}).items())
+        self.fillrate = fillrate
+        self.orders = {}
+        self.mine = set()
+        self.lock = threading.Lock()
+
+    def seed(self, maker, taker, price, count, spread=0.05, minsize=1, maxsize=100):
+        # adds count orders from other makers on both sides of maker/taker
+        # around price (taker per maker)
+        with self.lock:
+            for i in range(count):
+                size = Decimal(str(round(random.uniform(minsize, maxsize), 6)))
+                if i % 2:
+                    # ask: sells maker above price
+                    quote = Decimal(str(price * (1 + random.uniform(0, spread))))
+                    self._add(maker, size, taker, size * quote, mine=False)
+                else:
+                    # bid: sells taker for maker below price
+                    quote = Decimal(str(price * (1 - random.uniform(0, spread))))
+                    self._add(taker, size * quote, maker, size, mine=False)
+
+    def _add(self, maker, maker_size, taker, taker_size, mine, maker_address='', taker_address=''):
+        order = {
+            'id': uuid.uuid4().hex + uuid.uuid4().hex,
+            'maker': maker,
+            'maker_size': amount(maker_size),
+            'maker_address': maker_address,
+            'taker': taker,
+            'taker_size': amount(taker_size),
+            'taker_address': taker_address,
+            'updated_at': now(),
+            'created_at': now(),
+            'status': 'open',
+        }
+        self.orders[order['id']] = order
+        if mine:
+            self.mine.add(order['id'])
+        return order
+
+    def _credit(self, asset, value):
+        self.balances[asset] = self.balances.get(asset, Decimal(0)) + value
+
+    def _setstatus(self, order, status):
+        order['status'] = status
+        order['updated_at'] = now()
+
+    def _fill(self, order):
+        # somebody took my order: the locked maker funds are gone, taker funds arrive
+        self._setstatus(order, 'finished')
+        self._credit(order['taker'], Decimal(order['taker_size']))
+
+    # rpc methods
+
+    def dxGetTokenBalances(self):
+        with self.lock:
+            return dict((asset, amount(value)) for asset, value in self.balances.items())
+
+    def dxGetMyOrders(self):
+        with self.lock:
+            if self.fillrate:
+                for oid in self.mine:
+                    order = self.orders[oid]
+                    if order['status'] == 'open' and random.random() < self.fillrate:
+                        self._fill(order)
+            return [dict(self.orders[oid]) for oid in self.mine]
+
+    def dxGetOrders(self):
+        with self.lock:
+            return [dict(order) for order in self.orders.values() if order['status'] == 'open']
+
+    def dxGetOrder(self, id):
+        with self.lock:
+            order = self.orders.get(id)
+            if order is None:
+                raise XBridgeError(NOT_FOUND, 'Order not found')
+            return dict(order)
+
+    def dxGetOrderBook(self, detail, maker, taker, maxorders=50):
+        if detail not in (1, 2, 3, 4):
+            raise XBridgeError(INVALID_PARAMETERS, 'detail must be 1, 2, 3 or 4')
+        with self.lock:
+            asks = []
+            bids = []
+            for order in self.orders.values():
+                if order['status'] != 'open':
+                    continue
+                if order['maker'] == maker and order['taker'] == taker:
+                    size = Decimal(order['maker_size'])
+                    asks.append([Decimal(order['taker_size']) / size, size, order['id']])
+                elif order['maker'] == taker and order['taker'] == maker:
+                    size = Decimal(order['taker_size'])
+                    bids.append([Decimal(order['maker_size']) / size, size, order['id']])
+        asks.sort(key=lambda x: x[0])
+        bids.sort(key=lambda x: x[0], reverse=True)
+        if detail == 1:
+            asks, bids = asks[:1], bids[:1]
+        elif detail != 3:
+            asks, bids = asks[:maxorders], bids[:maxorders]
+        entries = lambda side: [[float('%.6f' % price), float(amount(size))] + ([oid] if detail in (3, 4) else [1]) for price, size, oid in side]
+        return {'detail': detail, 'maker': maker, 'taker': taker, 'asks': entries(asks), 'bids': entries(bids)}
+
+    def dxMakeOrder(self, maker, maker_size, maker_address, taker, taker_size, taker_address, type='exact', dryrun=None):
+        try:
+            maker_size = Decimal(str(maker_size))
+            taker_size = Decimal(str(taker_size))
+        except ArithmeticError:
+            raise XBridgeError(INVALID_PARAMETERS, 'invalid amount')
+        if maker == taker or maker_size <= 0 or taker_size <= 0:
+            raise XBridgeError(INVALID_PARAMETERS, 'invalid order')
+        with self.lock:
+            if self.balances.get(maker, Decimal(0)) < maker_size:
+                raise XBridgeError(INSUFFICIENT_FUNDS, 'Insufficient funds for {}'.format(maker))
+            if dryrun == 'dryrun':
+                return {'maker': maker, 'maker_size': amount(maker_size), 'taker': taker,
+                        'taker_size': amount(taker_size), 'status': 'created'}
+            # funds are locked while the order is open
+            self._credit(maker, -maker_size)
+            return dict(self._add(maker, maker_size, taker, taker_size, True, maker_address, taker_address))
+
+    def dxTakeOrder(self, id, from_address, to_address, dryrun=None):
+        with self.lock:
+            order = self.orders.get(id)
+            if order is None or order['status'] != 'open':
+                raise XBridgeError(NOT_FOUND, 'Order not found')
+            if id in self.mine:
+                raise XBridgeError(INVALID_PARAMETERS, 'Cannot take own order')
+            taker_size = Decimal(order['taker_size'])
+            if self.balances.get(order['taker'], Decimal(0)) < taker_size:
+                raise XBridgeError(INSUFFICIENT_FUNDS, 'Insufficient funds for {}'.format(order['taker']))
+            if dryrun == 'dryrun':
+                return dict(order)
+            self._credit(order['taker'], -taker_size)
+            self._credit(order['maker'], Decimal(order['maker_size']))
+            self._setstatus(order, 'finished')
+            result = dict(order)
+            result['status'] = 'accepting'
+            return result
+
+    def dxCancelOrder(self, id):
+        with self.lock:
+            order = self.orders.get(id)
+            if order is None or id not in self.mine:
+                raise XBridgeError(NOT_FOUND, 'Order not found')
+            if order['status'] != 'open':
+                raise XBridgeError(INVALID_PARAMETERS, 'Order is {}'.format(order['status']))
+            self._credit(order['maker'], Decimal(order['maker_size']))
+            self._setstatus(order, 'canceled')
+            return dict(order)
+
+    METHODS = ('dxGetTokenBalances', 'dxGetMyOrders', 'dxGetOrders', 'dxGetOrder', 'dxGetOrderBook',
+               'dxMakeOrder', 'dxTakeOrder', 'dxCancelOrder')
+
+
+def encodejson(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(repr(o) + " is not JSON serializable")
+
+
+class FakeXBridgeServer(ThreadingHTTPServer):
+    # JSON-RPC over HTTP/1.1 keep-alive in front of a FakeXBridge.
+    # latency/jitter: seconds added to every request, errorrate: fraction of
+    # calls answered with an RPC error, droprate: fraction of requests whose
+    # connection is closed without an answer
+
+    daemon_threads = True
+
+    def __init__(self, address, wallet, rpcuser=None, rpcpassword=None,
+                 latency=0.0, jitter=0.0, errorrate=0.0, droprate=0.0):
+        ThreadingHTTPServer.__init__(self, address, FakeXBridgeHandler)
+        self.wallet = wallet
+        self.auth = None
+        if rpcuser is not None:
+            self.auth = 'Basic ' + base64.b64encode('{}:{}'.format(rpcuser, rpcpassword).encode('utf8')).decode('ascii')
+        self.latency = latency
+        self.jitter = jitter
+        self.errorrate = errorrate
+        self.droprate = droprate
+        self.requests = 0
+        self.calls = 0
+
+    def call(self, request):
+        self.calls += 1
+        response = {'result': None, 'error': None, 'id': request.get('id')}
+        method = request.get('method')
+        try:
+            if method not in FakeXBridge.METHODS:
+                raise XBridgeError(-32601, 'Method not found')
+            if self.errorrate and random.random() < self.errorrate:
+                raise XBridgeError(INJECTED_ERROR, 'injected error')
+            response['result'] = getattr(self.wallet, method)(*request.get('params', []))
+        except XBridgeError as e:
+            response['error'] = {'code': e.code, 'message': e.message}
+        except TypeError as e:
+            response['error'] = {'code': INVALID_PARAMETERS, 'message': str(e)}
+        return response
+
+    def handle_error(self, request, client_address):
+        # clients dropping their connection (eg. an abandoned stream_) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+    def start(self):
+        # serves in a daemon thread, returns the thread
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeXBridgeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        server.requests += 1
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if server.auth is not None and self.headers.get('Authorization') != server.auth:
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if server.droprate and random.random() < server.droprate:
+            self.close_connection = True
+            return
+        try:
+            request = json.loads(body.decode('utf8'))
+        except ValueError:
+            response = {'result': None, 'error': {'code': -32700, 'message': 'Parse error'}, 'id': None}
+        else:
+            if isinstance(request, list):
+                response = [server.call(call) for call in request]
+            else:
+                response = server.call(request)
+        data = json.dumps(response, default=encodejson).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
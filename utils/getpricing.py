@@ -8,14 +8,112 @@ __maintainer__ = 'atcsecure'
 __status__ = 'Alpha'
 
 import time
-import sys
-import requests
-from utils import coingecko
-from bittrex.bittrex import Bittrex, API_V2_0
+import threading
+import logging
+import concurrent.futures
 from utils import custompricing
 from utils import dxsettings
+from utils import metrics
 
-my_bittrex = Bittrex(None, None)
+log = logging.getLogger(__name__)
+
+# price source clients are created on first use, so a run that never
+# touches a source never imports its (slow to load) libraries
+my_bittrex = None
+cg = None
+cg_index = None
+# the maker loop and its price watcher thread may ask for a client at
+# the same time, only one of them creates it
+clientlock = threading.Lock()
+
+PRICE_TTL = 10 # seconds a fetched price is served before it is refreshed
+PRICE_MAXSTALE = 120 # seconds after which a price that failed to refresh is not served
+BATCHED_SOURCES = ('cg',) # sources that price any number of assets in one request
+PRICE_SOURCES = ('cg', 'custom', 'cb', 'bt') # sources queried by the aggregate ('agg') source
+PRICE_DEADLINE = 5 # seconds the aggregate source waits for quotes
+PRICE_WORKERS = 8 # assets of a source without batching fetched at once
+PRICE_RULE = 'median' # how the aggregate source combines quotes: median, weighted or first
+PRICE_MAXDEVIATION = 0.05 # quotes further than this from the median are dropped
+FEED_SOCKET = 'pricefeed.sock' # Unix socket of the pricefeed.py daemon
+FEED_SOURCE = 'cg' # source the daemon is asked for, when not set with feedsource
+
+# price feed client for the 'feed' source, created on first use. feedsource
+# is the source the daemon prices from, dxsettings.feedsource if not set
+feed = None
+feedsource = None
+
+# runs the aggregate source's fetches. shared by every call so a source
+# that hangs ties up one of its threads until the request times out,
+# instead of leaking a new thread on every refresh
+aggexecutor = concurrent.futures.ThreadPoolExecutor(max_workers=2 * len(PRICE_SOURCES), thread_name_prefix='price')
+# runs the per-asset fetches of a source without batching. apart from
+# aggexecutor, as an 'agg' fetch waits on aggexecutor and must not hold
+# one of its threads while doing so
+assetexecutor = concurrent.futures.ThreadPoolExecutor(max_workers=PRICE_WORKERS, thread_name_prefix='asset')
+
+
+def getcoingecko():
+  # shared CoinGecko client and symbol index, created on first use
+  global cg, cg_index
+  if cg_index is None:
+    with clientlock:
+      if cg_index is None:
+        from utils import coingecko
+        from utils import coingeckoindex
+        client = coingecko.CoinGeckoAPI()
+        index = coingeckoindex.CoinGeckoIndex(client,
+                                              cachefile=getattr(dxsettings, 'cgindexfile', None),
+                                              refresh=getattr(dxsettings, 'cgindexrefresh', coingeckoindex.CG_INDEX_REFRESH),
+                                              overrides=getattr(dxsettings, 'cgidoverride', None))
+        # cg_index last, it is what tells other threads both are ready
+        cg = client
+        cg_index = index
+  return cg, cg_index
+
+
+def getfeed():
+  global feed
+  if feed is None:
+    with clientlock:
+      if feed is None:
+        from utils import pricefeed
+        feed = pricefeed.FeedClient(getattr(dxsettings, 'feedsocket', FEED_SOCKET),
+                                    feedsource or getattr(dxsettings, 'feedsource', FEED_SOURCE))
+  return feed
+
+
+def getfeedprices(assets):
+  # BTC price of assets from the price feed daemon, in one local request.
+  # a quote older than pricecache.maxstale counts as no price, as does
+  # every asset while the daemon cannot be reached or gives no usable
+  # answer, eg. when it does not serve the source asked for
+  try:
+    return timedfetch('feed', getfeed().get, assets, pricecache.maxstale)
+  except OSError as e:
+    log.warning('#### Price feed {} not answering: {}'.format(getfeed().path, e))
+    return {}
+  except (ValueError, KeyError) as e:
+    log.warning('#### Price feed {} answer not usable: {}'.format(getfeed().path, e))
+    return {}
+
+
+def crossprice(prices, maker, taker):
+  # maker price in taker from BTC prices, 0 if either is missing
+  try:
+    return prices[maker] / prices[taker]
+  except (KeyError, ZeroDivisionError):
+    log.error('Price set to 0')
+    return 0
+
+
+def getbittrex():
+  global my_bittrex
+  if my_bittrex is None:
+    with clientlock:
+      if my_bittrex is None:
+        from bittrex.bittrex import Bittrex
+        my_bittrex = Bittrex(None, None)
+  return my_bittrex
 
 
 def getmarketprice(marketname, BOTuse):
@@ -26,82 +124,336 @@ def getmarketprice(marketname, BOTuse):
   if markets[1] == 'BTC':
     marketname = '{}-{}'.format(markets[1], markets[0])
 
+  if BOTuse == 'agg':
+    # every source is already tried, no Bittrex fallback
+    return float(getaggregateprice(markets[1]))
+
   if BOTuse == 'custom':
-    print('### custom ####')
+    log.debug('### custom ####')
     asset = markets[1]
-    print('>>>> Looking up custom pricing: {}'.format(marketname))
+    log.debug('>>>> Looking up custom pricing: {}'.format(marketname))
     # lets get maker price
     try:
         endpoint = dxsettings.apiendpoint[asset]
         lastprice = custompricing.getprice(asset,endpoint)
     except Exception as e:
-        print('ERROR: {}'.format(e))
-        print('program aborted...')
-        sys.exit(1)
-    print(lastprice)
+        # raised like any failing source, so the price cache can go on
+        # serving the last good price
+        raise RuntimeError('custom price for {} failed: {}'.format(asset, e))
+    log.debug(lastprice)
 
   if BOTuse == 'cg':
-    print('>>>> Looking up CoinGecko pricing: {}'.format(markets[1]))
-    cg = coingecko.CoinGeckoAPI()
-    cg_coin_list = cg.get_coins_list()
+    log.debug('>>>> Looking up CoinGecko pricing: {}'.format(markets[1]))
+    cg, cg_index = getcoingecko()
     # CoinGecko uses IDs, need to lookup ID for market
-    for coin in cg_coin_list:
-      if coin['symbol'] == markets[1].lower():
-        coin_id = coin['id']
-        print('Found {} ID: {}'.format(markets[1],coin_id))
-        currentprice = cg.get_price(ids=coin_id, vs_currencies=markets[0])
-        lastprice = currentprice[coin_id]
-        vsmarket = markets[0].lower()
-        print('Last price: {}'.format(lastprice[vsmarket]))
-        lastprice = lastprice[vsmarket]
-        break
+    try:
+      coin_id = cg_index.lookup(markets[1])
+    except LookupError as e:
+      log.error(e)
+      coin_id = None
+    if coin_id:
+      log.debug('Found {} ID: {}'.format(markets[1],coin_id))
+      currentprice = cg.get_price(ids=coin_id, vs_currencies=markets[0])
+      lastprice = currentprice[coin_id]
+      vsmarket = markets[0].lower()
+      log.debug('Last price: {}'.format(lastprice[vsmarket]))
+      lastprice = lastprice[vsmarket]
 
   if BOTuse == 'cb' and dxsettings.cryptobridgeURL:
-    resp = requests.get(url=dxsettings.cryptobridgeURL)
-    data = resp.json()
-    cbmarketname = '{}_{}'.format(markets[1], markets[0])
-    print('>>>> Looking up CryptoBridge market: {}'.format(cbmarketname))
-    for z in data:
-      if (z['id']) == cbmarketname:
-        lastprice = z['last']
-        print('>>>> Found market: {}, Price: {}'.format(cbmarketname,lastprice))
+    lastprice = getcbprice(markets[1], markets[0])
 
   if not lastprice:
-    print('>>>> Looking up Bittrex market: {}'.format(marketname))
-    for attempt in range(0,5):
-      summary = my_bittrex.get_market_summary(marketname)
+    lastprice = getbtprice(marketname)
+  return float(lastprice)
+
+
+def getcbprice(asset, base='BTC'):
+  import requests
+  resp = requests.get(url=dxsettings.cryptobridgeURL, timeout=getattr(dxsettings, 'pricedeadline', PRICE_DEADLINE))
+  data = resp.json()
+  cbmarketname = '{}_{}'.format(asset, base)
+  log.debug('>>>> Looking up CryptoBridge market: {}'.format(cbmarketname))
+  lastprice = 0
+  for z in data:
+    if (z['id']) == cbmarketname:
+      lastprice = z['last']
+      log.debug('>>>> Found market: {}, Price: {}'.format(cbmarketname,lastprice))
+  return lastprice
+
+
+def getbtprice(marketname, attempts=5):
+  log.debug('>>>> Looking up Bittrex market: {}'.format(marketname))
+  lastprice = 0
+  for attempt in range(0,attempts):
+    summary = getbittrex().get_market_summary(marketname)
+    try:
+      lastprice = summary['result'][0]['Last'] 
+    except Exception as e:
+      log.warning('#### API call attempt #{2} - exception/error: {0}, Bittrex call failed for: {1}'.format(e, marketname, attempt))
+      log.warning(summary)
+      lastprice = 0
+      if attempt + 1 < attempts:
+        time.sleep(2.5)
+      continue
+    break
+  return lastprice
+
+
+def timedfetch(source, fetch, *args):
+  # fetch(*args), with its latency and failure recorded against source
+  start = time.perf_counter()
+  try:
+    return fetch(*args)
+  except Exception:
+    metrics.price_errors.inc(source)
+    raise
+  finally:
+    metrics.price_seconds.observe(time.perf_counter() - start, source)
+
+
+def getsourceprice(asset, source):
+  # BTC price of asset from one source alone, 0 if it has none
+  if source == 'custom':
+    return float(custompricing.getprice(asset, dxsettings.apiendpoint[asset]))
+  if source == 'cg':
+    return getcgprices([asset]).get(asset, 0)
+  if source == 'cb':
+    return float(getcbprice(asset) or 0) if dxsettings.cryptobridgeURL else 0
+  if source == 'bt':
+    return float(getbtprice('BTC-{}'.format(asset), attempts=1) or 0)
+  raise ValueError('unknown price source: {}'.format(source))
+
+
+def median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+
+def getaggregateprice(asset, sources=None, deadline=None, rule=None, weights=None, maxdeviation=None):
+  # queries every source at once and waits at most deadline seconds. with 3
+  # or more quotes, those more than maxdeviation (a fraction) away from the
+  # median are dropped; the rest are combined by rule: 'median', 'weighted'
+  # (weights per source, default 1) or 'first' (first good quote to arrive)
+  if sources is None:
+    sources = getattr(dxsettings, 'pricesources', PRICE_SOURCES)
+  if deadline is None:
+    deadline = getattr(dxsettings, 'pricedeadline', PRICE_DEADLINE)
+  if rule is None:
+    rule = getattr(dxsettings, 'pricerule', PRICE_RULE)
+  if weights is None:
+    weights = getattr(dxsettings, 'priceweights', {})
+  if maxdeviation is None:
+    maxdeviation = getattr(dxsettings, 'pricemaxdeviation', PRICE_MAXDEVIATION)
+  if asset == 'BTC':
+    return 1.0
+
+  # sources still running at the deadline are abandoned, not waited for
+  futures = dict((aggexecutor.submit(timedfetch, source, getsourceprice, asset, source), source) for source in sources)
+  quotes = {}
+  try:
+    for future in concurrent.futures.as_completed(futures, timeout=deadline):
+      source = futures[future]
       try:
-        lastprice = summary['result'][0]['Last'] 
+        price = future.result()
       except Exception as e:
-        print('#### API call attempt #{2} - exception/error: {0}, Bittrex call failed for: {1}'.format(e, marketname, attempt))
-        print(summary)
-        time.sleep(2.5)
-        lastprice = 0
+        log.warning('#### {} price from {} failed: {}'.format(asset, source, e))
         continue
-      break
-  return float(lastprice)
+      if price > 0:
+        quotes[source] = price
+        if rule == 'first':
+          break
+  except concurrent.futures.TimeoutError:
+    late = [futures[f] for f in futures if not f.done()]
+    log.warning('#### {} price sources past {}s deadline: {}'.format(asset, deadline, ', '.join(late)))
+  if not quotes:
+    return 0
+
+  if len(quotes) >= 3:
+    mid = median(quotes.values())
+    outliers = [source for source, price in quotes.items() if abs(price - mid) / mid > maxdeviation]
+    for source in outliers:
+      log.warning('#### Dropping {} price from {}: {} is more than {:.1%} from median {}'.format(asset, source, quotes[source], maxdeviation, mid))
+      del quotes[source]
+
+  log.debug('>>>> {} quotes: {}'.format(asset, quotes))
+  if rule == 'weighted':
+    total = sum(weights.get(source, 1) for source in quotes)
+    if not total:
+      return 0
+    return sum(price * weights.get(source, 1) for source, price in quotes.items()) / total
+  if rule == 'first':
+    return list(quotes.values())[0]
+  return median(quotes.values())
+
+
+def getcgprices(assets):
+  # BTC price of every asset from a single CoinGecko simple/price request
+  cg, cg_index = getcoingecko()
+  prices = {}
+  ids = {}
+  for asset in assets:
+    if asset == 'BTC':
+      prices[asset] = 1.0
+      continue
+    try:
+      coin_id = cg_index.lookup(asset)
+    except LookupError as e:
+      log.error(e)
+      continue
+    if coin_id:
+      ids.setdefault(coin_id, []).append(asset)
+  if ids:
+    log.debug('>>>> Looking up CoinGecko pricing: {}'.format(', '.join(sorted(assets))))
+    currentprices = cg.get_price(ids=','.join(sorted(ids)), vs_currencies='btc')
+    for coin_id, idassets in ids.items():
+      lastprice = currentprices.get(coin_id, {}).get('btc')
+      if lastprice:
+        for asset in idassets:
+          prices[asset] = float(lastprice)
+  return prices
+
+
+class PriceCache(object):
+  # last good BTC price per (asset, source). a price older than ttl is
+  # refreshed in a background thread while the cached value keeps being
+  # served; once older than maxstale it is not served at all (price 0),
+  # which stops the bot quoting on a dead price source
+
+  def __init__(self, ttl=PRICE_TTL, maxstale=PRICE_MAXSTALE):
+    self.ttl = ttl
+    self.maxstale = maxstale
+    self.__prices = {}
+    self.__refreshing = set()
+    self.__lock = threading.Lock()
+
+  def fetch(self, assets, source):
+    # fetches and caches the BTC price of assets. a batched source also
+    # re-fetches every asset it already has cached, in the same request,
+    # any other fetches all assets at once. the prices that came in are
+    # cached even when another asset failed, whose error is raised then
+    error = None
+    if source in BATCHED_SOURCES:
+      with self.__lock:
+        assets = set(assets) | set(a for (a, s) in self.__prices if s == source)
+      prices = timedfetch(source, getcgprices, assets)
+      for asset in assets:
+        if not prices.get(asset):
+          # not on CoinGecko, fall back to Bittrex like getmarketprice does
+          prices[asset] = timedfetch('bt', getmarketprice, 'BTC-{}'.format(asset), 'bt')
+    else:
+      futures = dict((asset, assetexecutor.submit(timedfetch, source, getmarketprice, 'BTC-{}'.format(asset), source))
+                     for asset in assets)
+      prices = {}
+      for asset, future in futures.items():
+        try:
+          prices[asset] = future.result()
+        except Exception as e:
+          error = error or e
+    fetched = time.time()
+    with self.__lock:
+      for asset, price in prices.items():
+        if price:
+          self.__prices[(asset, source)] = (price, fetched)
+    if error is not None:
+      raise error
+    return prices
+
+  def quotes(self, assets, source):
+    # {asset: (price, time.time() it was fetched)} of the cached assets,
+    # without fetching or refreshing anything
+    with self.__lock:
+      return dict((asset, self.__prices[(asset, source)]) for asset in assets if (asset, source) in self.__prices)
+
+  def _refresh(self, refreshkey, asset, source):
+    try:
+      self.fetch([asset], source)
+    except Exception as e:
+      log.warning('#### Price refresh failed for {} ({}): {}'.format(asset, source, e))
+    finally:
+      with self.__lock:
+        self.__refreshing.discard(refreshkey)
+
+  def prefetch(self, assets, source):
+    # fetches, in one request for a batched source, the assets not cached yet
+    with self.__lock:
+      missing = [asset for asset in assets if (asset, source) not in self.__prices]
+    if missing:
+      self.fetch(missing, source)
+
+  def get(self, asset, source):
+    key = (asset, source)
+    with self.__lock:
+      cached = self.__prices.get(key)
+    if cached is None:
+      # nothing to serve yet, fetch in the foreground
+      return self.fetch([asset], source).get(asset, 0)
+    price, fetched = cached
+    age = time.time() - fetched
+    if age > self.ttl:
+      # one refresh of a batched source updates all of its assets
+      if source in BATCHED_SOURCES:
+        refreshkey = (None, source)
+      else:
+        refreshkey = key
+      with self.__lock:
+        start = refreshkey not in self.__refreshing
+        self.__refreshing.add(refreshkey)
+      if start:
+        threading.Thread(target=self._refresh, args=(refreshkey, asset, source), daemon=True).start()
+    if age > self.maxstale:
+      log.warning('#### Price for {} ({}) is {:.0f}s old, not quoting'.format(asset, source, age))
+      return 0
+    return price
+
+
+pricecache = PriceCache()
 
 
 def getpricedata(maker, taker, BOTuse):
+  if BOTuse == 'feed':
+    return crossprice(getfeedprices([maker, taker]), maker, taker)
   basemarket = ('BTC-{}'.format(maker))
   takermarket = ('BTC-{}'.format(taker))
-  print('>>>> Maker: {}, Taker: {}'.format(maker,taker))
-  print('>>>> Base market: {}'.format(basemarket))
+  log.debug('>>>> Maker: {}, Taker: {}'.format(maker,taker))
+  log.debug('>>>> Base market: {}'.format(basemarket))
+  # both legs in one request when the source supports it
+  pricecache.prefetch([maker, taker], BOTuse)
   if maker == 'BTC':
-    marketprice = 1/getmarketprice(takermarket, BOTuse)
+    try:
+      marketprice = 1/pricecache.get(taker, BOTuse)
+    except ZeroDivisionError:
+      marketprice = 0
+      log.error('Price set to 0')
     return marketprice
-  makerprice = getmarketprice(basemarket, BOTuse)
-  print('>>>> Taker market: {}'.format(takermarket))
+  makerprice = pricecache.get(maker, BOTuse)
+  log.debug('>>>> Taker market: {}'.format(takermarket))
   if taker == 'BTC':
     marketprice = makerprice
   else:
-    takerprice = getmarketprice(takermarket, BOTuse)
+    takerprice = pricecache.get(taker, BOTuse)
     try:
       marketprice = makerprice / takerprice
     except:
       marketprice = 0
-      print('ERROR: Price set to 0')
+      log.error('Price set to 0')
   return marketprice
 
 
+def getpricedatabatch(pairs, BOTuse):
+  # maker/taker price for every (maker, taker) pair. with a batched source
+  # (CoinGecko) every asset comes from one request and each cross rate is
+  # derived from that single response
+  assets = set()
+  for maker, taker in pairs:
+    assets.update((maker, taker))
+  if BOTuse == 'feed':
+    prices = getfeedprices(sorted(assets))
+    return dict(((maker, taker), crossprice(prices, maker, taker)) for maker, taker in pairs)
+  pricecache.prefetch(sorted(assets), BOTuse)
+  return dict(((maker, taker), getpricedata(maker, taker, BOTuse)) for maker, taker in pairs)
+
+
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
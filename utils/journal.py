@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# append-only journal of the orders the maker bot placed, canceled and saw
+# filled, in SQLite with write-ahead logging so a crash never loses an
+# acknowledged write. on startup reconcile() settles it against
+# dxGetMyOrders, and the bot goes on managing the orders still open
+# instead of canceling everything
+import json
+import sqlite3
+import threading
+import time
+
+JOURNALFILE = 'orderjournal.db'
+
+# wallet order states after which a taker has the order
+FILLED = ('accepting', 'hold', 'initialized', 'created', 'committed', 'finished')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    id TEXT NOT NULL,
+    market TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    market TEXT NOT NULL,
+    maker_size TEXT,
+    taker_size TEXT,
+    quote REAL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status, market);
+'''
+
+
+class Journal(object):
+    # events is the journal itself, orders the latest state of every order
+    # in it. both change in the same transaction
+
+    def __init__(self, path=JOURNALFILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # with WAL a commit survives the process crashing, only a power
+        # loss can take back the last few
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _event(self, now, oid, market, event, data):
+        self.conn.execute('INSERT INTO events (time, id, market, event, data) VALUES (?, ?, ?, ?, ?)',
+                          (now, oid, market, event, json.dumps(data, default=str)))
+
+    def placed(self, market, order, quote=None):
+        # order is the dxMakeOrder result, quote the market price it was placed at
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (order['id'], market, str(order['maker_size']), str(order['taker_size']),
+                               quote, 'open', now, now))
+            self._event(now, order['id'], market, 'placed',
+                        {'maker_size': order['maker_size'], 'taker_size': order['taker_size'], 'quote': quote})
+
+    def closed(self, market, oid, status):
+        # the order left the book with the wallet status status ('canceled',
+        # 'finished', ...), or 'gone' when the wallet no longer reports it
+        if status in FILLED:
+            event = 'filled'
+        elif status == 'canceled':
+            event = 'canceled'
+        else:
+            event = 'closed'
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE orders SET status = ?, updated = ? WHERE id = ?', (status, now, oid))
+            self._event(now, oid, market, event, {'status': status})
+
+    def openorders(self, market=None):
+        # orders the journal has open, newest first
+        with self.lock:
+            if market is None:
+                rows = self.conn.execute("SELECT * FROM orders WHERE status = 'open' ORDER BY created DESC")
+            else:
+                rows = self.conn.execute("SELECT * FROM orders WHERE status = 'open' AND market = ? ORDER BY created DESC",
+                                         (market,))
+            return [dict(row) for row in rows]
+
+    def events(self, oid):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute('SELECT * FROM events WHERE id = ? ORDER BY seq', (oid,))]
+
+    def reconcile(self, myorders, markets=None):
+        # closes the journal's open orders the wallet (dxGetMyOrders result
+        # myorders) reports as closed or no longer knows. returns counts of
+        # orders kept open, closed, and open in the wallet but not in the
+        # journal (placed by hand or by another bot). the journal leaves
+        # those alone, the maker bot manages them with its own orders in
+        # the same market as it always has. with markets ('MAKER-TAKER'
+        # names) only their orders are settled, the rest may belong to
+        # another bot sharing the journal and placing orders meanwhile
+        wallet = dict((z['id'], z) for z in myorders)
+        kept = 0
+        closed = 0
+        known = set()
+        for row in self.openorders():
+            known.add(row['id'])
+            if markets is not None and row['market'] not in markets:
+                continue
+            z = wallet.get(row['id'])
+            if z is not None and z['status'] == 'open':
+                kept += 1
+                continue
+            self.closed(row['market'], row['id'], z['status'] if z is not None else 'gone')
+            closed += 1
+        unknown = len([oid for oid, z in wallet.items() if z['status'] == 'open' and oid not in known and
+                       (markets is None or '{}-{}'.format(z['maker'], z['taker']) in markets)])
+        return {'open': kept, 'closed': closed, 'unknown': unknown}
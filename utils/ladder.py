@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# builds a ladder of maker orders: levels prices between slidemin and
+# slidemax times the market price, and levels sizes between sellmin and
+# sellmax, all in one pass, rounded to each asset's precision
+import random
+from utils.amount import Amount, DEFAULT_DECIMALS, ratio
+
+DISTRIBUTIONS = ('linear', 'geometric', 'random')
+
+
+def spread(low, high, levels, distribution):
+    # levels values from low to high
+    if levels == 1:
+        return [low]
+    if distribution == 'linear':
+        step = (high - low) / (levels - 1)
+        return [low + step * i for i in range(levels)]
+    if distribution == 'geometric':
+        factor = (high / low) ** (1.0 / (levels - 1))
+        return [low * factor ** i for i in range(levels)]
+    if distribution == 'random':
+        return sorted(random.uniform(low, high) for i in range(levels))
+    raise ValueError('unknown ladder distribution: {} (use one of {})'.format(distribution, ', '.join(DISTRIBUTIONS)))
+
+
+def buildladder(marketprice, levels, sellmin, sellmax, slidemin, slidemax,
+                distribution='linear', makerdecimals=DEFAULT_DECIMALS, takerdecimals=DEFAULT_DECIMALS):
+    # returns [(sellamount, buyamount), ...] as Amounts, tightest price first.
+    # buy amounts are rounded up so no order is priced below its slide,
+    # levels whose size rounds to nothing are dropped
+    slides = spread(float(slidemin), float(slidemax), levels, distribution)
+    sizes = spread(float(sellmin), float(sellmax), levels, distribution)
+    price = ratio(float(marketprice))
+    ladder = []
+    for slide, size in zip(slides, sizes):
+        sellamount = Amount.parse(size, makerdecimals)
+        buyamount = sellamount.convert(ratio(price, slide), takerdecimals, 'up')
+        if sellamount.units > 0 and buyamount.units > 0:
+            ladder.append((sellamount, buyamount))
+    return ladder
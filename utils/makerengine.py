@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+# runs any number of maker/taker markets in one process. every pass takes
+# one wallet snapshot (balances + my orders) and one batched price lookup
+# shared by all markets, then lets each market place/cancel its orders.
+# passes are paced by an AdaptiveScheduler: they run right away on a price
+# move or an order reaching its max age, come every delay seconds while
+# something changes, and back off towards maxdelay while markets are idle
+import time
+import random
+import json
+import logging
+import os
+import threading
+from utils import dxbottools
+from utils import getpricing as pricebot
+from utils import dxsettings
+from utils import metrics
+from utils import ladder as orderladder
+from utils.amount import Amount, getdecimals, ratio
+from utils.scheduler import AdaptiveScheduler
+
+log = logging.getLogger(__name__)
+
+MAXDELAY = 30 # seconds between passes once every market is idle
+STATUSINTERVAL = 1 # min seconds between writes of the status file
+
+# per-market parameters, same defaults as the dxmakerbot.py flags
+MARKET_DEFAULTS = {
+    'sellmin': 0.001,
+    'sellmax': 1,
+    'slidemin': 1.000001,
+    'slidemax': 1.019999,
+    'maxloop': 7,
+    'maxopen': 5,
+    'minbalance': 10,
+    'maxage': None, # seconds before the oldest order is canceled, default maxloop * delay
+    'pricethreshold': 0.02, # price move that makes a market cancel and requote its orders
+    'ladder': 0, # orders placed per pass as a price ladder, 0 places one random order
+    'ladderdist': 'linear', # how ladder prices and sizes are spread: linear, geometric or random
+}
+
+
+class MarketMaker(object):
+    # state of one maker/taker market, what used to be dxmakerbot.py globals
+
+    def __init__(self, maker, taker, sellmin=MARKET_DEFAULTS['sellmin'], sellmax=MARKET_DEFAULTS['sellmax'],
+                 slidemin=MARKET_DEFAULTS['slidemin'], slidemax=MARKET_DEFAULTS['slidemax'],
+                 maxloop=MARKET_DEFAULTS['maxloop'], maxopen=MARKET_DEFAULTS['maxopen'],
+                 minbalance=MARKET_DEFAULTS['minbalance'], maxage=MARKET_DEFAULTS['maxage'],
+                 pricethreshold=MARKET_DEFAULTS['pricethreshold'], ladder=MARKET_DEFAULTS['ladder'],
+                 ladderdist=MARKET_DEFAULTS['ladderdist'], price=None):
+        self.maker = maker.upper()
+        self.taker = taker.upper()
+        if self.maker == self.taker:
+            raise ValueError('Maker and taker asset cannot be the same: {}'.format(self.maker))
+        self.sellmin = float(sellmin)
+        self.sellmax = float(sellmax)
+        self.slidemin = float(slidemin)
+        self.slidemax = float(slidemax)
+        self.maxloop = int(maxloop)
+        self.maxopen = int(maxopen)
+        self.minbalance = float(minbalance)
+        self.maxage = float(maxage) if maxage is not None else None
+        self.pricethreshold = float(pricethreshold)
+        self.ladder = int(ladder)
+        if ladderdist not in orderladder.DISTRIBUTIONS:
+            raise ValueError('unknown ladder distribution: {}'.format(ladderdist))
+        if self.ladder and ladderdist == 'geometric' and (self.sellmin <= 0 or self.slidemin <= 0):
+            raise ValueError('geometric ladder needs sellmin and slidemin above 0: {}-{}'.format(self.maker, self.taker))
+        self.ladderdist = ladderdist
+        self.price = price
+        self.makerdecimals = getdecimals(self.maker)
+        self.takerdecimals = getdecimals(self.taker)
+        try:
+            self.makeraddress = dxsettings.tradingaddress[self.maker]
+            self.takeraddress = dxsettings.tradingaddress[self.taker]
+        except KeyError as e:
+            raise KeyError('{} (check dxsettings.py for address entry)'.format(e))
+        self.ordercount = 0
+        self.lastprice = None
+        self.requote = False
+        self.lastbalance = None
+        self.lastopenids = None
+        self.canceled = set()
+        self.report = {}
+        self.journal = None
+
+    def __str__(self):
+        return '{}-{}'.format(self.maker, self.taker)
+
+    def placeorder(self, makermarketprice, spare):
+        # generate random sell amount, no more than the spare balance above
+        # minbalance
+        sellamount = min(Amount.parse(random.uniform(self.sellmin, self.sellmax), self.makerdecimals), spare)
+        # adjust price based on slide value, rounding up so the order is not
+        # priced below it
+        slide = random.uniform(self.slidemin, self.slidemax)
+        log.debug('>>>> {} slide adjusted maker price: {}'.format(self, float(makermarketprice) * slide))
+        buyamount = sellamount.convert(ratio(float(makermarketprice), slide), self.takerdecimals, 'up')
+        log.debug('>>>> {} sell amount: {}, buy amount: {}'.format(self, sellamount, buyamount))
+        try:
+            log.debug('>>>> Placing order...')
+            start = time.perf_counter()
+            results = dxbottools.makeorder(self.maker, sellamount, self.makeraddress, self.taker, buyamount, self.takeraddress)
+        except Exception as err:
+            log.error('{} placing order failed: {}'.format(self, err))
+            metrics.orders_failed.inc(str(self))
+            return False
+        self.recordplaced(results, time.perf_counter() - start)
+        return True
+
+    def recordplaced(self, result, seconds):
+        # records an order placed seconds after asking for it
+        order = {'id': result['id'], 'maker_size': result['maker_size'], 'taker_size': result['taker_size'],
+                 'price': float(result['taker_size']) / float(result['maker_size']), 'seconds': round(seconds, 6)}
+        self.report.setdefault('placed', []).append(order)
+        metrics.orders_placed.inc(str(self))
+        self.tojournal('placed', result, self.lastprice)
+        log.debug('>>>> Order placed - id: {0}, maker_size: {1}, taker_size: {2}'.format(result['id'], result['maker_size'], result['taker_size']),
+                  extra={'data': dict(order, event='placed', market=str(self))})
+
+    def placeladder(self, makermarketprice, levels, spare):
+        # quotes levels orders at once, tightest price first, in one batched
+        # call. levels that would take the balance below minbalance are left out
+        orders = []
+        for sellamount, buyamount in orderladder.buildladder(makermarketprice, self.ladder, self.sellmin, self.sellmax,
+                                                             self.slidemin, self.slidemax, self.ladderdist,
+                                                             self.makerdecimals, self.takerdecimals)[:levels]:
+            if sellamount > spare:
+                break
+            spare = spare - sellamount
+            orders.append((sellamount, buyamount))
+        if not orders:
+            return 0
+        log.debug('>>>> Placing ladder of {} orders...'.format(len(orders)))
+        start = time.perf_counter()
+        results = dxbottools.makeorders([(self.maker, sellamount, self.makeraddress, self.taker, buyamount, self.takeraddress)
+                                         for sellamount, buyamount in orders])
+        seconds = time.perf_counter() - start
+        placed = 0
+        for result in results:
+            if isinstance(result, Exception):
+                log.error('{} placing order failed: {}'.format(self, result))
+                metrics.orders_failed.inc(str(self))
+                continue
+            placed += 1
+            self.recordplaced(result, seconds)
+        return placed
+
+    def canceloldest(self, snapshot):
+        try:
+            results = dxbottools.canceloldestorder(self.maker, self.taker, snapshot.myorders)
+        except Exception:
+            metrics.orders_failed.inc(str(self))
+            raise
+        if results[0]:
+            metrics.orders_canceled.inc(str(self))
+            self.report['canceled'] = self.report.get('canceled', 0) + 1
+            self.tojournal('closed', results[0], 'canceled')
+        log.debug('>>>> {} canceled oldest: {}'.format(self, results),
+                  extra={'data': {'event': 'canceled', 'market': str(self), 'id': results[0], 'reason': 'age'}})
+        self.canceled.add(results[0])
+        self.ordercount = 0
+
+    def cancelopen(self, orderids):
+        # requote after a price move: the open orders sit at the old price
+        report = dxbottools.cancelorders(orderids)
+        for orderid, result in report.items():
+            if result['status'] == 'canceled':
+                metrics.orders_canceled.inc(str(self))
+                self.report['canceled'] = self.report.get('canceled', 0) + 1
+                self.tojournal('closed', orderid, 'canceled')
+            else:
+                metrics.orders_failed.inc(str(self))
+        log.debug('>>>> {} canceled {} orders on price move'.format(self, len(report)),
+                  extra={'data': {'event': 'canceled', 'market': str(self), 'orders': report, 'reason': 'price'}})
+        self.canceled.update(orderids)
+        self.ordercount = 0
+
+    def restore(self, journaled, openids):
+        # picks up the orders a previous run left open: journaled are this
+        # market's open orders in the journal, newest first, openids the
+        # ones open in the wallet. the first pass then only requotes them
+        # if the price moved past pricethreshold since they were placed
+        # if the price they were placed at is not known, as for orders not
+        # in the journal, they are requoted at the current price right away
+        quotes = [row['quote'] for row in journaled if row['quote']]
+        if quotes:
+            self.lastprice = quotes[0]
+        elif openids:
+            self.requote = True
+        self.lastopenids = set(openids)
+        self.ordercount = len(self.lastopenids)
+
+    def tojournal(self, event, *args):
+        # the journal is best-effort, failing to write it never changes
+        # what happened to an order or stops the pass
+        if self.journal is None:
+            return
+        try:
+            getattr(self.journal, event)(str(self), *args)
+        except Exception as err:
+            log.warning('#### {} journal {} failed: {}'.format(self, event, err))
+
+    def nextdeadline(self):
+        # time.time() at which the oldest open order reaches maxage
+        oldest = dxbottools.orderstore.oldest(self.maker, self.taker)
+        if oldest is None:
+            return None
+        return oldest[0] + self.maxage
+
+    def events(self, snapshot, makermarketprice, now):
+        # what changed for this market since its last pass
+        events = []
+        makerbalance = snapshot.balances.get(self.maker) or Amount(0, self.makerdecimals)
+        openids = set(zz['id'] for zz in dxbottools.orderstore.openorders(self.maker, self.taker))
+        if self.lastopenids is not None:
+            gone = self.lastopenids - openids - self.canceled
+            if gone:
+                events.append('fill')
+            for oid in gone:
+                z = dxbottools.orderstore.byid.get(oid)
+                self.tojournal('closed', oid, z['status'] if z is not None else 'gone')
+        self.canceled &= openids
+        if self.lastbalance is not None and makerbalance != self.lastbalance:
+            events.append('balance')
+        if self.requote or self.lastprice and makermarketprice and abs(makermarketprice - self.lastprice) / self.lastprice > self.pricethreshold:
+            events.append('price')
+            self.requote = False
+        deadline = self.nextdeadline()
+        if deadline is not None and now >= deadline:
+            events.append('age')
+        self.lastopenids = openids
+        self.lastbalance = makerbalance
+        return events
+
+    def step(self, snapshot, makermarketprice, now=None):
+        # one pass of the maker loop against a shared wallet snapshot.
+        # returns True if anything changed or was done
+        if now is None:
+            now = time.time()
+        self.report = {'price': makermarketprice, 'balance': None, 'events': []}
+        events = self.events(snapshot, makermarketprice, now)
+        makerbalance = self.lastbalance
+        self.report.update(balance=makerbalance, events=events)
+        log.debug('>>>> {} balance: {}, market price: {}, events: {}'.format(self, makerbalance, makermarketprice, events))
+        if 'fill' in events:
+            # let the filled orders be replaced
+            self.ordercount = len(self.lastopenids)
+        if 'price' in events:
+            self.cancelopen(list(self.lastopenids))
+        elif 'age' in events:
+            self.canceloldest(snapshot)
+        if makermarketprice and ('price' in events or self.lastprice is None):
+            self.lastprice = makermarketprice
+        placed = False
+        if makerbalance > 0:
+            if not makermarketprice:
+                log.warning('#### {} pricing not available, not placing orders'.format(self))
+                return bool(events)
+            currentopenorders = len(self.lastopenids - self.canceled)
+            self.report['open'] = currentopenorders
+            log.debug('>>>> Current open orders: {}, maker: {}, taker: {}'.format(currentopenorders, self.maker, self.taker))
+            # what can be sold without going below minbalance
+            spare = makerbalance - Amount.parse(self.minbalance, self.makerdecimals)
+            if spare <= 0 or spare < Amount.parse(self.sellmin, self.makerdecimals, 'up'):
+                log.debug('##### {} balance {} at minbalance {}, not placing orders'.format(self, makerbalance, self.minbalance))
+            elif self.ladder and (max(currentopenorders, self.ordercount) < self.maxopen):
+                levels = min(self.ladder, self.maxopen - max(currentopenorders, self.ordercount))
+                count = self.placeladder(makermarketprice, levels, spare)
+                placed = count > 0
+                self.ordercount += count
+            elif (self.ordercount < self.maxopen) and (currentopenorders < self.maxopen):
+                placed = self.placeorder(makermarketprice, spare)
+                self.ordercount += 1
+            else:
+                log.debug('##### Too many orders open - open order count: {}'.format(currentopenorders))
+        return bool(events) or placed
+
+    def summary(self):
+        # the last pass in a few words, for the loop record
+        report = self.report
+        parts = [str(self), 'price={:.8g}'.format(report['price'] or 0), 'open={}'.format(report.get('open', '-'))]
+        if report.get('placed'):
+            parts.append('placed={}'.format(len(report['placed'])))
+        if report.get('canceled'):
+            parts.append('canceled={}'.format(report['canceled']))
+        if report['events']:
+            parts.append('events={}'.format(','.join(report['events'])))
+        if report.get('error'):
+            parts.append('error')
+        return ' '.join(parts)
+
+
+class MakerEngine(object):
+    # drives a set of MarketMakers off one RPC client, price cache and
+    # balance snapshot
+
+    def __init__(self, markets, BOTuse, delay, maxdelay=MAXDELAY, journal=None, statusfile=None):
+        self.markets = markets
+        self.BOTuse = BOTuse
+        self.journal = journal
+        self.statusfile = statusfile
+        self.passes = 0
+        self.errors = 0
+        self.lasterror = None
+        self.statuswritten = 0
+        for market in self.markets:
+            market.journal = journal
+        self.delay = float(delay)
+        self.scheduler = AdaptiveScheduler(self.delay, maxdelay)
+        for market in self.markets:
+            if market.maxage is None:
+                market.maxage = market.maxloop * self.delay
+
+    def getprices(self):
+        # one batched lookup per price source for every market using it
+        prices = {}
+        bysource = {}
+        for market in self.markets:
+            bysource.setdefault(market.price or self.BOTuse, []).append((market.maker, market.taker))
+        for source, pairs in bysource.items():
+            for pair, price in pricebot.getpricedatabatch(pairs, source).items():
+                prices[(pair, source)] = price
+        return prices
+
+    def marketprice(self, prices, market):
+        return prices[((market.maker, market.taker), market.price or self.BOTuse)]
+
+    def checkprices(self):
+        # True if every market has a price to start quoting from
+        ok = True
+        prices = self.getprices()
+        for market in self.markets:
+            marketprice = self.marketprice(prices, market)
+            log.info('>>>> {} market price: {}'.format(market, marketprice))
+            if marketprice == 0:
+                log.warning('#### Pricing not available for {}'.format(market))
+                ok = False
+        return ok
+
+    def watchprices(self):
+        # wakes the scheduler when a price moves past a market's threshold,
+        # prices come from the shared cache so this costs no extra fetches
+        while 1:
+            time.sleep(max(self.delay, pricebot.pricecache.ttl))
+            try:
+                prices = self.getprices()
+            except Exception as err:
+                log.error('price watch failed: %s', err)
+                continue
+            for market in self.markets:
+                price = self.marketprice(prices, market)
+                if market.lastprice and price and abs(price - market.lastprice) / market.lastprice > market.pricethreshold:
+                    self.scheduler.wake('price {}'.format(market))
+
+    def restore(self):
+        # settles the journal against the wallet and hands every market the
+        # orders it left open. returns the journal.reconcile() counts
+        snapshot = dxbottools.getsnapshot()
+        # only this bot's markets, the journal may be shared with other bots
+        # on the same wallet
+        counts = self.journal.reconcile(snapshot.myorders, set(str(market) for market in self.markets))
+        for market in self.markets:
+            openids = [zz['id'] for zz in dxbottools.orderstore.openorders(market.maker, market.taker)]
+            market.restore(self.journal.openorders(str(market)), openids)
+        log.info('>>>> Journal {}: {} open orders picked up, {} closed while stopped, {} open orders not in the journal, managed with the rest'.format(
+            self.journal.path, counts['open'], counts['closed'], counts['unknown']), extra={'data': dict(counts, event='restore')})
+        return counts
+
+    def runonce(self, reasons=()):
+        # returns True if any market was active. logs one record for the
+        # pass, reasons are what woke it up
+        start = time.perf_counter()
+        snapshot = dxbottools.getsnapshot()
+        fetched = time.perf_counter()
+        prices = self.getprices()
+        priced = time.perf_counter()
+        active = False
+        now = time.time()
+        for market in self.markets:
+            # one market failing must not keep the others from quoting
+            try:
+                if market.step(snapshot, self.marketprice(prices, market), now):
+                    active = True
+            except Exception as err:
+                log.exception('%s pass failed: %s', market, err)
+                market.report['error'] = str(err)
+                self.errors += 1
+                self.lasterror = '{}: {}'.format(market, err)
+        seconds = time.perf_counter() - start
+        log.info('pass {:.3f}s {} | {}'.format(seconds, ','.join(reasons) or 'delay',
+                                              ' | '.join(market.summary() for market in self.markets)),
+                 extra={'data': {'event': 'pass', 'seconds': round(seconds, 6), 'rpc_seconds': round(fetched - start, 6),
+                                 'price_seconds': round(priced - fetched, 6), 'wake': list(reasons),
+                                 'markets': dict((str(market), market.report) for market in self.markets)}})
+        self.passes += 1
+        return active
+
+    def writestatus(self):
+        # the last pass of every market as JSON in statusfile, for
+        # dxsupervisor.py. replaced in one rename so a reader never sees
+        # half a file
+        now = time.time()
+        if self.statusfile is None or now - self.statuswritten < STATUSINTERVAL:
+            return
+        status = {'pid': os.getpid(), 'time': now, 'passes': self.passes, 'errors': self.errors,
+                  'lasterror': self.lasterror,
+                  'markets': dict((str(market), dict(market.report, summary=market.summary()) if market.report else {})
+                                  for market in self.markets)}
+        try:
+            with open(self.statusfile + '.tmp', 'w') as f:
+                json.dump(status, f, default=str)
+            os.replace(self.statusfile + '.tmp', self.statusfile)
+            self.statuswritten = now
+        except OSError as err:
+            log.warning('#### Could not write status file {}: {}'.format(self.statusfile, err))
+
+    def nextdeadline(self):
+        # deadlines already past were handled (or failed) in the last pass,
+        # they must not turn the loop into a busy wait
+        now = time.time()
+        deadlines = [deadline for deadline in (market.nextdeadline() for market in self.markets)
+                     if deadline is not None and deadline > now]
+        return min(deadlines) if deadlines else None
+
+    def run(self):
+        threading.Thread(target=self.watchprices, daemon=True).start()
+        reasons = []
+        while 1:  # loop forever
+            try:
+                with metrics.loop_seconds.time():
+                    active = self.runonce(reasons)
+            except Exception as err:
+                log.exception('maker loop failed: %s', err)
+                self.errors += 1
+                self.lasterror = str(err)
+                active = False
+            self.writestatus()
+            self.scheduler.done(active)
+            reasons = self.scheduler.wait(self.nextdeadline())
+
+
+def loadconfig(path):
+    # reads a multi-market config file:
+    # {"delay": 3, "price": "cg",
+    #  "markets": [{"maker": "BLOCK", "taker": "LTC", "sellmin": 0.001, ...}, ...]}
+    # per-market keys not given fall back to "defaults", then MARKET_DEFAULTS.
+    # "endpoint": {"host": ..., "port": ..., "rpcuser": ..., "rpcpassword": ...}
+    # is the wallet RPC to use instead of the dxsettings one
+    with open(path) as f:
+        config = json.load(f)
+    if 'endpoints' in config:
+        raise ValueError('{} spreads markets over several endpoints, run it with dxsupervisor.py'.format(path))
+    defaults = dict(MARKET_DEFAULTS)
+    defaults.update(config.get('defaults', {}))
+    markets = []
+    for entry in config['markets']:
+        params = dict(defaults)
+        params.update(entry)
+        markets.append(MarketMaker(**params))
+    return config, markets
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# in-process counters and histograms, served in the Prometheus text format
+# by serve(port) at http://127.0.0.1:port/metrics
+import threading
+import time
+from bisect import bisect_left
+
+# seconds, fine enough to tell a local wallet call from a price API call
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+registry = []
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def formatlabels(labelnames, labelvalues, extra=None):
+    pairs = ['{}="{}"'.format(name, escape(value)) for name, value in zip(labelnames, labelvalues)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def formatvalue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self.values.get(labelvalues, 0)
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labelvalues, value in values:
+            yield self.name + formatlabels(self.labelnames, labelvalues), value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues: [count per bucket (last one +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labelvalues)
+            if entry is None:
+                entry = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def time(self, *labelvalues):
+        return Timer(self, labelvalues)
+
+    def count(self, *labelvalues):
+        entry = self.values.get(labelvalues)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self.lock:
+            values = sorted((labelvalues, list(counts), total) for labelvalues, (counts, total) in self.values.items())
+        for labelvalues, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket' + formatlabels(self.labelnames, labelvalues, ('le', formatvalue(bound))), cumulative
+            yield self.name + '_sum' + formatlabels(self.labelnames, labelvalues), total
+            yield self.name + '_count' + formatlabels(self.labelnames, labelvalues), cumulative
+
+
+class Timer(object):
+    # with histogram.time(labels): observes the seconds spent in the block
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append('# HELP {} {}'.format(metric.name, metric.help))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        for sample, value in metric.samples():
+            lines.append('{} {}'.format(sample, formatvalue(value)))
+    return '\n'.join(lines) + '\n'
+
+
+rpc_seconds = Histogram('dxbot_rpc_seconds', 'XBridge JSON-RPC call latency, a batch counts once as method batch', ['method'])
+rpc_errors = Counter('dxbot_rpc_errors_total', 'XBridge JSON-RPC calls that failed, by method and error code', ['method', 'code'])
+price_seconds = Histogram('dxbot_price_fetch_seconds', 'price fetch latency by price source', ['source'])
+price_errors = Counter('dxbot_price_fetch_errors_total', 'price fetches that failed, by price source', ['source'])
+loop_seconds = Histogram('dxbot_loop_seconds', 'maker loop pass duration, sleeping excluded')
+taker_loop_seconds = Histogram('dxbot_taker_loop_seconds', 'taker loop pass duration, sleeping excluded')
+orders_placed = Counter('dxbot_orders_placed_total', 'orders placed by market', ['market'])
+orders_canceled = Counter('dxbot_orders_canceled_total', 'orders canceled by market', ['market'])
+orders_taken = Counter('dxbot_orders_taken_total', 'orders of other makers taken by market', ['market'])
+orders_failed = Counter('dxbot_orders_failed_total', 'order placements, cancels and takes that failed, by market', ['market'])
+
+
+def serve(port, host='127.0.0.1'):
+    # serves /metrics from a daemon thread, returns the server. http.server
+    # is only imported here, it is slow to load for runs without metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            data = render().encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# one price poller shared by every bot on the machine. PriceFeed polls the
+# BTC price of each asset once per interval through getpricing, whatever
+# number of bots asks for it, and FeedServer answers from its table over a
+# Unix socket. bots read it with FeedClient, the 'feed' price source, so
+# they make no price requests of their own.
+# protocol: one JSON object per line each way, on a kept open connection
+#   -> {"source": "cg", "assets": ["BLOCK", "LTC"]}
+#   <- {"quotes": {"BLOCK": [price, fetched], "LTC": [price, fetched]}, "time": now}
+# fetched and now are epoch seconds, an asset without a price is left out
+import errno
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from utils import getpricing as pricebot
+
+log = logging.getLogger(__name__)
+
+INTERVAL = 10 # seconds between polls of the assets asked for
+
+
+class PriceFeed(object):
+    # the assets bots asked for, per source, kept fresh in pricecache by
+    # a poll thread. an asset asked for the first time is fetched right away
+
+    def __init__(self, sources, interval=INTERVAL):
+        self.sources = tuple(sources)
+        self.interval = float(interval)
+        self.assets = dict((source, set()) for source in self.sources)
+        self.lock = threading.Lock()
+        self.polls = 0
+
+    def subscribe(self, assets, source):
+        # adds assets to the ones polled, fetching those not priced yet
+        with self.lock:
+            new = set(assets) - self.assets[source]
+            self.assets[source].update(new)
+        new = [asset for asset in new if asset not in pricebot.pricecache.quotes([asset], source)]
+        if new:
+            try:
+                pricebot.pricecache.fetch(new, source)
+            except Exception as e:
+                log.warning('#### {} price fetch failed for {}: {}'.format(source, ', '.join(sorted(new)), e))
+
+    def quotes(self, assets, source):
+        if source not in self.assets:
+            raise ValueError('source {} is not served, the feed serves: {}'.format(source, ', '.join(self.sources)))
+        assets = [asset for asset in assets if asset != 'BTC']
+        self.subscribe(assets, source)
+        return pricebot.pricecache.quotes(assets, source)
+
+    def poll(self):
+        # one request per source for a batched source, else one per asset
+        for source in self.sources:
+            with self.lock:
+                assets = sorted(self.assets[source])
+            if not assets:
+                continue
+            try:
+                pricebot.pricecache.fetch(assets, source)
+            except Exception as e:
+                log.warning('#### {} price poll failed: {}'.format(source, e))
+        self.polls += 1
+
+    def run(self):
+        while 1:
+            start = time.time()
+            self.poll()
+            time.sleep(max(0.0, self.interval - (time.time() - start)))
+
+
+class FeedHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf8'))
+                quotes = self.server.feed.quotes(request['assets'], request.get('source', self.server.feed.sources[0]))
+                response = {'quotes': quotes, 'time': time.time()}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': str(e), 'time': time.time()}
+            self.wfile.write(json.dumps(response).encode('utf8') + b'\n')
+
+
+class FeedServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, feed):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                # left behind by a feed that did not shut down cleanly
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            else:
+                raise OSError(errno.EADDRINUSE, 'a price feed is already serving on {}'.format(path))
+            finally:
+                probe.close()
+        socketserver.ThreadingUnixStreamServer.__init__(self, path, FeedHandler)
+        self.path = path
+        self.feed = feed
+
+    def server_close(self):
+        socketserver.ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class FeedClient(object):
+    # reads prices from a FeedServer over one kept open connection,
+    # reconnecting once when it was dropped
+
+    def __init__(self, path, source, timeout=5.0):
+        self.path = path
+        self.source = source
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+            self.reader = None
+
+    def request(self, assets):
+        data = json.dumps({'source': self.source, 'assets': list(assets)}).encode('utf8') + b'\n'
+        with self.lock:
+            for attempt in (1, 2):
+                reconnected = self.sock is None
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(data)
+                    line = self.reader.readline()
+                    if not line:
+                        raise ConnectionError('price feed closed the connection')
+                    break
+                except OSError:
+                    self.close()
+                    if reconnected or attempt == 2:
+                        raise
+            try:
+                response = json.loads(line.decode('utf8'))
+            except ValueError:
+                # the stream is out of step, start over on a new connection
+                self.close()
+                raise
+        if 'error' in response:
+            raise ValueError('price feed: {}'.format(response['error']))
+        return response
+
+    def get(self, assets, maxstale=None):
+        # {asset: BTC price} for every asset, 0 when the feed has no price
+        # or only one older than maxstale seconds
+        response = self.request([asset for asset in assets if asset != 'BTC'])
+        quotes = response['quotes']
+        prices = {}
+        for asset in assets:
+            if asset == 'BTC':
+                prices[asset] = 1.0
+                continue
+            price, fetched = quotes.get(asset, (0, 0))
+            if maxstale is not None and response['time'] - fetched > maxstale:
+                if price:
+                    log.warning('#### Feed price for {} is {:.0f}s old, not quoting'.format(asset, response['time'] - fetched))
+                price = 0
+            prices[asset] = price
+        return prices
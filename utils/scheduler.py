@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import threading
+import time
+
+
+class AdaptiveScheduler(object):
+    # paces the maker loop. wait() returns as soon as wake() is called (price
+    # move, fill, ...) or a deadline (eg. an order reaching its max age)
+    # passes, otherwise after the current delay. the delay grows by backoff
+    # after every idle pass, up to maxdelay, and drops back to mindelay after
+    # a pass that did something
+
+    def __init__(self, mindelay, maxdelay, backoff=2.0):
+        self.mindelay = float(mindelay)
+        self.maxdelay = max(float(maxdelay), self.mindelay)
+        self.backoff = backoff
+        self.delay = self.mindelay
+        self.__reasons = []
+        self.__lock = threading.Lock()
+        self.__event = threading.Event()
+
+    def wake(self, reason):
+        with self.__lock:
+            self.__reasons.append(reason)
+        self.__event.set()
+
+    def done(self, active):
+        # report whether the last pass was active
+        if active:
+            self.delay = self.mindelay
+        else:
+            self.delay = min(self.delay * self.backoff, self.maxdelay)
+
+    def wait(self, deadline=None):
+        # sleeps until woken, deadline (a time.time() value) or the current
+        # delay, whichever comes first. returns the wake reasons
+        timeout = self.delay
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.time()))
+        self.__event.wait(timeout)
+        with self.__lock:
+            self.__event.clear()
+            reasons = self.__reasons
+            self.__reasons = []
+        if not reasons and deadline is not None and time.time() >= deadline:
+            reasons = ['deadline']
+        return reasons
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# runs the markets of one config across several dxmakerbot.py processes,
+# each against one wallet RPC endpoint. markets selling the same asset on
+# the same endpoint share a balance, so they always go to the same worker.
+# a worker that exits is started again after a delay that doubles on every
+# quick exit, and the status files the workers write are merged into one
+# view
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+WORKDIR = 'workers'
+STATUSINTERVAL = 10 # seconds between combined status views
+RESTARTMIN = 1 # seconds before the first restart of an exited worker
+RESTARTMAX = 60 # longest delay between restarts
+STABLE = 60 # seconds a worker must run for its restart delay to reset
+STOPTIMEOUT = 10 # seconds a stopped worker gets to exit before it is killed
+BOTSCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dxmakerbot.py')
+
+
+def loadconfig(path):
+    # a dxmakerbot.py config with a list of wallet RPC endpoints:
+    # {"endpoints": [{"name": "a", "host": "127.0.0.1", "port": 41414,
+    #                 "rpcuser": ..., "rpcpassword": ...}, ...],
+    #  "markets": [{"maker": "BLOCK", "taker": "LTC", "endpoint": "a", ...}, ...]}
+    # endpoint keys not given come from dxsettings, a market without
+    # "endpoint" runs on the first one
+    with open(path) as f:
+        config = json.load(f)
+    endpoints = config.get('endpoints') or [{}]
+    names = [str(endpoint.get('name', i)) for i, endpoint in enumerate(endpoints)]
+    if len(set(names)) != len(names):
+        raise ValueError('endpoint names must be unique: {}'.format(', '.join(names)))
+    for entry in config['markets']:
+        if str(entry.get('endpoint', names[0])) not in names:
+            raise ValueError('market {}-{} uses unknown endpoint {}'.format(entry['maker'], entry['taker'], entry['endpoint']))
+    return config
+
+
+def endpointname(endpoint):
+    return '{}:{}'.format(endpoint.get('host', '127.0.0.1'), endpoint.get('port', 'default'))
+
+
+def shard(config, workers):
+    # worker configs for config, at most workers of them but at least one
+    # per endpoint in use. every endpoint gets workers in proportion to its
+    # markets, and each group of markets sharing an endpoint and maker asset
+    # goes to the worker with the fewest markets so far
+    endpoints = config.get('endpoints') or [{}]
+    names = [str(endpoint.get('name', i)) for i, endpoint in enumerate(endpoints)]
+    groups = {}
+    for entry in config['markets']:
+        entry = dict(entry)
+        name = str(entry.pop('endpoint', names[0]))
+        groups.setdefault(names.index(name), {}).setdefault(entry['maker'].upper(), []).append(entry)
+    slots = dict((index, 1) for index in groups)
+    size = dict((index, sum(len(markets) for markets in group.values())) for index, group in groups.items())
+    for i in range(max(0, workers - len(slots))):
+        # next slot to the endpoint with the most markets per worker that
+        # still has a group left to split off
+        index = max((index for index in slots if slots[index] < len(groups[index])),
+                    key=lambda index: size[index] / slots[index], default=None)
+        if index is None:
+            break
+        slots[index] += 1
+    base = dict((key, value) for key, value in config.items() if key not in ('endpoints', 'markets'))
+    shards = []
+    for index in sorted(groups):
+        endpoint = dict((key, value) for key, value in endpoints[index].items() if key != 'name')
+        bins = [[] for i in range(slots[index])]
+        for markets in sorted(groups[index].values(), key=len, reverse=True):
+            min(bins, key=len).extend(markets)
+        for markets in bins:
+            shards.append(dict(base, endpoint=endpoint, markets=markets))
+    return shards
+
+
+class Worker(object):
+    # one dxmakerbot.py process and its files in workdir
+
+    def __init__(self, index, config, workdir, args=()):
+        self.index = index
+        self.config = config
+        self.args = list(args)
+        prefix = os.path.join(workdir, 'worker{}'.format(index))
+        self.configfile = prefix + '.json'
+        self.statusfile = prefix + '.status.json'
+        # one journal per wallet, shared by the workers on it, so a market
+        # finds its orders again whichever worker it lands in next run
+        self.journal = os.path.join(workdir, 'journal-{}.db'.format(endpointname(config['endpoint']).replace(':', '-')))
+        self.logfile = prefix + '.log'
+        self.process = None
+        self.started = None
+        self.restarts = 0
+        self.exitcode = None
+        self.delay = RESTARTMIN
+        self.nextstart = 0
+
+    def __str__(self):
+        return 'worker{}'.format(self.index)
+
+    def start(self):
+        with open(self.configfile, 'w') as f:
+            json.dump(self.config, f, indent=2)
+        command = [sys.executable, BOTSCRIPT, '--config', self.configfile, '--journal', self.journal,
+                   '--logfile', self.logfile, '--statusfile', self.statusfile] + self.args
+        # the worker logs to its own file, its console output is not needed
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        self.started = time.time()
+        log.info('>>>> {} started, pid {}: {}'.format(self, self.process.pid, ', '.join(
+            '{}-{}'.format(market['maker'], market['taker']) for market in self.config['markets'])))
+
+    def poll(self, now):
+        # restarts the worker once it exited and its delay is over
+        if self.process is not None:
+            code = self.process.poll()
+            if code is None:
+                return
+            self.exitcode = code
+            self.process = None
+            if now - self.started >= STABLE:
+                self.delay = RESTARTMIN
+            self.nextstart = now + self.delay
+            log.warning('#### {} exited with code {}, restarting in {}s'.format(self, code, self.delay),
+                        extra={'data': {'event': 'exit', 'worker': self.index, 'code': code, 'delay': self.delay}})
+            self.delay = min(self.delay * 2, RESTARTMAX)
+        elif now >= self.nextstart:
+            if self.started is not None:
+                self.restarts += 1
+            self.start()
+
+    def stop(self):
+        # SIGINT, so the worker flushes its log on the way out
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def status(self, now):
+        try:
+            with open(self.statusfile) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            status = {}
+        running = self.process is not None
+        # a status file left by a previous run of the worker says nothing yet
+        if not running or status.get('pid') != self.process.pid:
+            status = dict(status, markets={})
+        return {'worker': self.index, 'pid': self.process.pid if running else None,
+                'endpoint': endpointname(self.config['endpoint']), 'running': running,
+                'restarts': self.restarts, 'exitcode': self.exitcode,
+                'uptime': round(now - self.started, 1) if running else 0,
+                'passes': status.get('passes', 0), 'errors': status.get('errors', 0),
+                'lastpass': round(now - status['time'], 1) if status.get('markets') else None,
+                'markets': status.get('markets', {}) or dict(
+                    ('{}-{}'.format(market['maker'].upper(), market['taker'].upper()), {})
+                    for market in self.config['markets'])}
+
+
+class Supervisor(object):
+
+    def __init__(self, shards, workdir=WORKDIR, args=(), statusinterval=STATUSINTERVAL, statusfile=None):
+        os.makedirs(workdir, exist_ok=True)
+        self.workers = [Worker(index, config, workdir, args) for index, config in enumerate(shards)]
+        self.statusinterval = float(statusinterval)
+        self.statusfile = statusfile or os.path.join(workdir, 'status.json')
+
+    def status(self):
+        now = time.time()
+        return {'time': now, 'workers': [worker.status(now) for worker in self.workers]}
+
+    def writestatus(self, status):
+        with open(self.statusfile + '.tmp', 'w') as f:
+            json.dump(status, f, default=str)
+        os.replace(self.statusfile + '.tmp', self.statusfile)
+
+    def view(self, status):
+        # one line per worker and one per market
+        lines = []
+        for worker in status['workers']:
+            lines.append('worker{} pid={} {} {} uptime={}s restarts={} passes={} errors={}{}'.format(
+                worker['worker'], worker['pid'] or '-', worker['endpoint'],
+                'running' if worker['running'] else 'exited({})'.format(worker['exitcode']),
+                worker['uptime'], worker['restarts'], worker['passes'], worker['errors'],
+                ' lastpass={}s ago'.format(worker['lastpass']) if worker['lastpass'] is not None else ''))
+            for market, report in sorted(worker['markets'].items()):
+                lines.append('    {}'.format(report.get('summary', market + ' waiting')))
+        return '\n'.join(lines)
+
+    def run(self):
+        shown = 0
+        try:
+            while 1:
+                now = time.time()
+                for worker in self.workers:
+                    worker.poll(now)
+                if now - shown >= self.statusinterval:
+                    status = self.status()
+                    self.writestatus(status)
+                    log.info(self.view(status), extra={'data': dict(status, event='status')})
+                    shown = now
+                time.sleep(0.5)
+        finally:
+            self.stop()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.time() + STOPTIMEOUT
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.process.wait(max(0.1, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                log.warning('#### {} did not stop, killing it'.format(worker))
+                worker.process.kill()
+                worker.process.wait()
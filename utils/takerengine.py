@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# takes other makers' orders that beat a reference price. every pass reads
+# balances, the order book of every market and the state of the swaps still
+# pending from earlier takes in one batched request, walks each book side
+# from its best price while orders beat the reference price by margin, and
+# takes the best of them in one batched request. at most maxpending swaps
+# run at once, and an order id is never taken twice
+import time
+import json
+import logging
+from utils import dxbottools
+from utils import getpricing as pricebot
+from utils import dxsettings
+from utils import metrics
+
+DELAY = 1 # seconds between passes
+MAXPENDING = 2 # swaps from my takes that may be in progress at once
+MAXTAKES = 1 # orders taken per pass
+
+# swap states after which a take no longer holds my funds
+DONE = ('finished', 'canceled', 'expired', 'offline', 'invalid', 'rolled back', 'rollback failed')
+
+SIDES = ('asks', 'bids', 'both')
+
+# per-market parameters, same defaults as the dxtaker.py flags
+MARKET_DEFAULTS = {
+    'margin': 0.02, # how far an order must beat the reference price, as a fraction
+    'maxsize': None, # largest order taken, in maker, None takes any size
+    'minbalance': 0, # balance kept of the asset paid for a take
+    'side': 'both', # asks buys maker, bids sells maker
+}
+
+
+class TakerMarket(object):
+    # order book and parameters of one maker/taker market. book prices and
+    # the reference price are in taker per maker, sizes in maker
+
+    def __init__(self, maker, taker, margin=MARKET_DEFAULTS['margin'], maxsize=MARKET_DEFAULTS['maxsize'],
+                 minbalance=MARKET_DEFAULTS['minbalance'], side=MARKET_DEFAULTS['side'], price=None):
+        self.maker = maker.upper()
+        self.taker = taker.upper()
+        if self.maker == self.taker:
+            raise ValueError('Maker and taker asset cannot be the same: {}'.format(self.maker))
+        self.margin = float(margin)
+        self.maxsize = float(maxsize) if maxsize is not None else None
+        self.minbalance = float(minbalance)
+        if side not in SIDES:
+            raise ValueError('unknown side: {}'.format(side))
+        self.side = side
+        self.price = price
+        try:
+            self.makeraddress = dxsettings.tradingaddress[self.maker]
+            self.takeraddress = dxsettings.tradingaddress[self.taker]
+        except KeyError as e:
+            raise KeyError('{} (check dxsettings.py for address entry)'.format(e))
+        self.book = dxbottools.OrderBook(self.maker, self.taker)
+
+    def __str__(self):
+        return '{}-{}'.format(self.maker, self.taker)
+
+    def candidates(self, refprice):
+        # (edge, side, entry) of the orders up to maxsize beating refprice by
+        # margin, best price first. edge is the fraction gained. the walk
+        # stops at the first order short of margin, so it only costs as much
+        # as the book is mispriced
+        candidates = []
+        if self.side in ('asks', 'both'):
+            # buying maker below the reference price
+            for z in self.book.asks.entries:
+                edge = 1 - float(z[0]) / refprice
+                if edge < self.margin:
+                    break
+                if self.maxsize is None or float(z[1]) <= self.maxsize:
+                    candidates.append((edge, 'asks', z))
+        if self.side in ('bids', 'both'):
+            # selling maker above the reference price
+            for z in self.book.bids.entries:
+                edge = float(z[0]) / refprice - 1
+                if edge < self.margin:
+                    break
+                if self.maxsize is None or float(z[1]) <= self.maxsize:
+                    candidates.append((edge, 'bids', z))
+        return candidates
+
+    def cost(self, side, z):
+        # (asset, amount) paid for taking order z
+        if side == 'asks':
+            return self.taker, float(z[0]) * float(z[1])
+        return self.maker, float(z[1])
+
+    def addresses(self, side):
+        # (from address, to address) for taking an order on side
+        if side == 'asks':
+            return self.takeraddress, self.makeraddress
+        return self.makeraddress, self.takeraddress
+
+
+class TakerEngine(object):
+    # drives a set of TakerMarkets off one RPC client and price cache
+
+    def __init__(self, markets, BOTuse, delay=DELAY, maxpending=MAXPENDING, maxtakes=MAXTAKES, dryrun=False):
+        self.markets = markets
+        self.bymarket = dict(((market.maker, market.taker), market) for market in markets)
+        self.BOTuse = BOTuse
+        self.delay = float(delay)
+        self.maxpending = int(maxpending)
+        self.maxtakes = int(maxtakes)
+        self.dryrun = dryrun
+        self.pending = {} # order id: (market, time taken) of swaps in progress
+        self.taken = set() # order ids taken (or tried) while they are in a book
+        self.reported = set() # order ids reported as too expensive while they are in a book
+
+    def getprices(self):
+        # one batched lookup per price source for every market using it
+        prices = {}
+        bysource = {}
+        for market in self.markets:
+            bysource.setdefault(market.price or self.BOTuse, []).append((market.maker, market.taker))
+        for source, pairs in bysource.items():
+            for pair, price in pricebot.getpricedatabatch(pairs, source).items():
+                prices[(pair, source)] = price
+        return prices
+
+    def marketprice(self, prices, market):
+        return prices[((market.maker, market.taker), market.price or self.BOTuse)]
+
+    def checkprices(self):
+        # True if every market has a reference price
+        ok = True
+        prices = self.getprices()
+        for market in self.markets:
+            marketprice = self.marketprice(prices, market)
+            print('>>>> {} reference price: {}'.format(market, marketprice))
+            if marketprice == 0:
+                print('#### Pricing not available for {}'.format(market))
+                ok = False
+        return ok
+
+    def checkpending(self, orders):
+        # drops the takes whose swap is over, orders is {id: order or exception}
+        for oid, order in orders.items():
+            market = self.pending[oid][0]
+            if isinstance(order, Exception):
+                print('#### {} lost track of take {}: {}'.format(market, oid, order))
+                logging.warning('Lost track of take {}: {}'.format(oid, order))
+            elif order['status'] in DONE:
+                print('>>>> {} take {} {}'.format(market, oid, order['status']))
+                logging.info('Take {} {}'.format(oid, order['status']))
+            else:
+                continue
+            del self.pending[oid]
+
+    def select(self, candidates, balances):
+        # picks the best edged candidates the free slots and balances allow.
+        # candidates are (edge, market, side, entry)
+        slots = min(self.maxtakes, self.maxpending - len(self.pending))
+        available = {}
+        takes = []
+        for edge, market, side, z in sorted(candidates, key=lambda x: -x[0]):
+            if len(takes) >= slots:
+                break
+            if z[2] in self.taken:
+                continue
+            asset, cost = market.cost(side, z)
+            if asset not in available:
+                available[asset] = float(balances.get(asset, 0))
+            if available[asset] - cost < market.minbalance:
+                if z[2] not in self.reported:
+                    self.reported.add(z[2])
+                    print('#### {} not enough {} to take {} for {:.6f}'.format(market, asset, z[2], cost))
+                continue
+            available[asset] -= cost
+            takes.append((edge, market, side, z))
+        return takes
+
+    def runonce(self):
+        # returns True if any order was taken
+        balances, books, orders = dxbottools.getbooks(self.bymarket, self.pending)
+        self.checkpending(orders)
+        inbook = set()
+        for market in self.markets:
+            market.book.update(*books[(market.maker, market.taker)])
+            inbook.update(market.book.asks.byid)
+            inbook.update(market.book.bids.byid)
+        # an id can only come back while it is still in a book
+        self.taken &= inbook
+        self.reported &= inbook
+        if len(self.pending) >= self.maxpending:
+            print('>>>> {} takes pending, not taking more'.format(len(self.pending)))
+            return False
+        prices = self.getprices()
+        candidates = []
+        for market in self.markets:
+            refprice = self.marketprice(prices, market)
+            if not refprice:
+                print('#### {} pricing not available, not taking orders'.format(market))
+                continue
+            for edge, side, z in market.candidates(float(refprice)):
+                candidates.append((edge, market, side, z))
+        takes = self.select(candidates, balances)
+        if not takes:
+            return False
+        print('>>>> Taking {} orders...'.format(len(takes)))
+        results = dxbottools.takeorders([(z[2],) + market.addresses(side) for edge, market, side, z in takes], self.dryrun)
+        now = time.time()
+        taken = False
+        for (edge, market, side, z), result in zip(takes, results):
+            self.taken.add(z[2])
+            if isinstance(result, Exception):
+                print('ERROR: {} take {}: {}'.format(market, z[2], result))
+                metrics.orders_failed.inc(str(market))
+                continue
+            taken = True
+            print('>>>> {} took {} {} price: {}, size: {}, edge: {:.2%}{}'.format(
+                market, side, z[2], z[0], z[1], edge, ' (dryrun)' if self.dryrun else ''))
+            logging.info('Order taken - id: {}, market: {}, side: {}, price: {}, size: {}, dryrun: {}'.format(
+                z[2], market, side, z[0], z[1], self.dryrun))
+            if not self.dryrun:
+                self.pending[z[2]] = (market, now)
+                metrics.orders_taken.inc(str(market))
+        return taken
+
+    def run(self):
+        while 1:  # loop forever
+            start = time.time()
+            try:
+                with metrics.taker_loop_seconds.time():
+                    self.runonce()
+            except Exception as err:
+                print('ERROR: %s' % err)
+                logging.exception('Taker loop failed')
+            time.sleep(max(0.0, self.delay - (time.time() - start)))
+
+
+def loadconfig(path):
+    # reads a multi-market config file:
+    # {"delay": 1, "price": "cg", "maxpending": 2, "maxtakes": 1,
+    #  "markets": [{"maker": "BLOCK", "taker": "LTC", "margin": 0.03, ...}, ...]}
+    # per-market keys not given fall back to "defaults", then MARKET_DEFAULTS
+    with open(path) as f:
+        config = json.load(f)
+    defaults = dict(MARKET_DEFAULTS)
+    defaults.update(config.get('defaults', {}))
+    markets = []
+    for entry in config['markets']:
+        params = dict(defaults)
+        params.update(entry)
+        markets.append(TakerMarket(**params))
+    return config, markets